@@ -0,0 +1,320 @@
+import os
+import io
+import json
+import time
+import random
+import hashlib
+import zipfile
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+import contextlib
+import subprocess
+import http.server
+import re
+import github2file
+
+DEFAULT_WORK_DIR = os.path.join(tempfile.gettempdir(), "github2file-bench")
+DEFAULT_MIX = "python=0.5,go=0.2,javascript=0.2,java=0.05,rust=0.05"
+DEFAULT_SAMPLE = 5000  # Files decompressed into memory for the per-stage benchmarks
+LANGUAGE_EXTENSIONS = {"python": ".py", "go": ".go", "javascript": ".js", "typescript": ".ts", "java": ".java", "rust": ".rs"}
+WORDS = ["value", "items", "count", "result", "config", "buffer", "index", "handler", "request", "node", "state", "cache"]
+
+def make_identifier(rng):
+    return "_".join(rng.sample(WORDS, 2)) + str(rng.randrange(1000))
+
+def make_python_file(rng, functions):
+    """Generate a Python module with a docstring, comments, functions and the occasional f-string."""
+    lines = [f'"""Module {make_identifier(rng)}: generated for benchmarking."""', "import os", ""]
+    for _ in range(functions):
+        name = make_identifier(rng)
+        lines += [f"# Helper for {name}", f"def {name}(value, items=None):",
+                  f'    """Return {name} for the value.', "", "    Longer description of the function.", '    """',
+                  "    result = []  # accumulated output", "    for item in items or []:",
+                  f"        result.append(f\"{{item}}-{{value}}\")  # {rng.choice(WORDS)}",
+                  "    return result", ""]
+    return "\n".join(lines)
+
+def make_c_like_file(rng, language, functions):
+    """Generate a Go, JavaScript, Java or Rust file with line and block comments, strings and functions."""
+    lines = ["/*", " * Generated for benchmarking.", " */"]
+    for _ in range(functions):
+        name = make_identifier(rng)
+        lines.append(f"// {name} handles the {rng.choice(WORDS)} // with a nested marker")
+        if language == "go":
+            lines += [f"func {name}(value int) string {{", '\treturn fmt.Sprintf("%d /* not a comment */", value)', "}"]
+        elif language == "javascript":
+            lines += [f"function {name}(value) {{", "  const pattern = /\\/\\*[^*]*\\*\\//g;", "  return `${value} // not a comment`.replace(pattern, '');", "}"]
+        elif language == "java":
+            lines += [f"public static String {name}(int value) {{", '    return "/* not a comment */" + value;', "}"]
+        else:
+            lines += [f"fn {name}(value: i32) -> String {{", "    /* outer /* nested */ comment */", '    format!("{} // not a comment", value)', "}"]
+        lines.append("")
+    return "\n".join(lines)
+
+def make_source_file(rng, language, functions):
+    if language == "python":
+        return make_python_file(rng, functions)
+    return make_c_like_file(rng, "javascript" if language == "typescript" else language, functions)
+
+def parse_mix(mix):
+    """Parse 'python=0.5,go=0.5' into a list of (language, weight)."""
+    weights = []
+    for part in mix.split(","):
+        language, _, weight = part.partition("=")
+        if language.strip() not in LANGUAGE_EXTENSIONS:
+            raise ValueError(f"Unknown language '{language}' in the language mix.")
+        weights.append((language.strip(), float(weight or 1)))
+    return weights
+
+def generate_archive(archive_path, files=1000, mix=DEFAULT_MIX, node_modules=0, vendor=0, minified=0, syntax_errors=0, tests=0.05, seed=0):
+    """
+    Write a synthetic repository archive shaped like a GitHub download ('bench-main/...'): files source files
+    in the given language mix spread over nested packages, plus node_modules and vendor trees, huge minified
+    bundles and Python files with syntax errors. The same arguments always produce the same archive.
+    """
+    rng = random.Random(seed)
+    languages, weights = zip(*parse_mix(mix))
+    root = "bench-main/"
+    with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr(root + "README.md", "# Benchmark repository\n\nGenerated by benchmark.py.\n")
+        for index in range(files):
+            language = rng.choices(languages, weights)[0]
+            depth = rng.randrange(1, 5)
+            directory = "/".join(f"pkg{rng.randrange(20)}" for _ in range(depth))
+            content = make_source_file(rng, language, rng.randrange(1, 12))
+            if rng.random() < tests:
+                content = ("import pytest\n" if language == "python" else "// import testing\n") + content
+            zip_file.writestr(f"{root}src/{directory}/file{index}{LANGUAGE_EXTENSIONS[language]}", content)
+        for index in range(node_modules):
+            depth = rng.randrange(1, 6)
+            directory = "/node_modules/".join(f"dep{rng.randrange(50)}" for _ in range(depth))
+            zip_file.writestr(f"{root}node_modules/{directory}/lib/index{index}.js", make_c_like_file(rng, "javascript", rng.randrange(1, 8)))
+        for index in range(vendor):
+            zip_file.writestr(f"{root}vendor/github.com/org{rng.randrange(30)}/lib/file{index}.go", make_c_like_file(rng, "go", rng.randrange(1, 8)))
+        for index in range(minified):
+            bundle = ";".join(f"var {make_identifier(rng)}=function(a){{return a*{rng.randrange(100)}}}" for _ in range(60000))
+            zip_file.writestr(f"{root}dist/bundle{index}.min.js", bundle)
+            zip_file.writestr(f"{root}src/generated/table{index}.py", "TABLE = [\n" + "    (1, 2, 3),\n" * 150000 + "]\n")
+        for index in range(syntax_errors):
+            zip_file.writestr(f"{root}src/broken/broken{index}.py", "def broken(:\n" + "    value = 1  # comment\n" * 20)
+    return archive_path
+
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Static file handler with single-range support, so that --sparse can be benchmarked too."""
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range", ""))
+        if not os.path.isfile(path) or not match:
+            return super().do_GET()
+        size = os.path.getsize(path)
+        first, last = match.groups()
+        start, end = (max(0, size - int(last)), size - 1) if not first else (int(first), min(int(last) if last else size - 1, size - 1))
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        with open(path, "rb") as served_file:
+            served_file.seek(start)
+            self.wfile.write(served_file.read(end - start + 1))
+
+    def log_message(self, format, *args):
+        pass
+
+@contextlib.contextmanager
+def serve_directory(directory):
+    """Serve directory over HTTP on a free local port and yield the base URL."""
+    handler = lambda *args, **kwargs: RangeRequestHandler(*args, directory=directory, **kwargs)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def time_call(function, repeat):
+    """Run function repeat times and return the best and median wall time in seconds."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return {"best_seconds": round(min(timings), 6), "median_seconds": round(statistics.median(timings), 6)}
+
+def throughput(result, size):
+    result["mb_per_second"] = round(size / (1024 * 1024) / result["best_seconds"], 2) if result["best_seconds"] else None
+    return result
+
+def bench_path_filter(names, lang, repeat):
+    """Compiled PathFilter against the original is_file_type and is_likely_useful_file pair."""
+    path_filter = github2file.PathFilter(lang)
+    compiled = time_call(lambda: [path_filter(name) for name in names], repeat)
+    legacy = time_call(lambda: [github2file.is_file_type(name, lang) and github2file.is_likely_useful_file(name, lang) for name in names], repeat)
+    return {"paths": len(names), "compiled": compiled, "legacy": legacy}
+
+def bench_classification(contents, lang, repeat):
+    """Fused is_substantive_file against the original is_test_file and has_sufficient_content pair."""
+    fused = time_call(lambda: [github2file.is_substantive_file(content, lang) for content in contents], repeat)
+    legacy = time_call(lambda: [not github2file.is_test_file(content, lang) and github2file.has_sufficient_content(content) for content in contents], repeat)
+    return {"files": len(contents), "fused": fused, "legacy": legacy}
+
+def bench_stripping(samples, repeat):
+    """Comment stripping throughput per language; for Python, the tokenize stripper against the AST one."""
+    results = {}
+    for extension, contents in sorted(samples.items()):
+        size = sum(len(content) for content in contents)
+        if extension == ".py":
+            parsable = []
+            for content in contents:
+                try:
+                    github2file.remove_comments_and_docstrings(content)
+                    parsable.append(content)
+                except (SyntaxError, ValueError):
+                    pass
+            parsable_size = sum(len(content) for content in parsable)
+            results["python_tokenize"] = throughput(time_call(lambda: [github2file.strip_python_comments(content) for content in parsable], repeat), parsable_size)
+            results["python_ast"] = throughput(time_call(lambda: [github2file.remove_comments_and_docstrings(content) for content in parsable], repeat), parsable_size)
+        else:
+            path = "file" + extension
+            results[extension.lstrip(".")] = throughput(time_call(lambda: [github2file.strip_comments(path, content) for content in contents], repeat), size)
+    return results
+
+def bench_writing(contents, repeat):
+    """Output writing throughput through OutputWriter into a temporary file."""
+    def write():
+        with tempfile.TemporaryFile() as outfile:
+            writer = github2file.OutputWriter(outfile, "python", claude=True)
+            writer.write_start()
+            for index, content in enumerate(contents):
+                writer.write_file(f"bench-main/file{index}.py", content)
+            writer.write_end()
+    return throughput(time_call(write, repeat), sum(len(content) for content in contents))
+
+def bench_end_to_end(base_url, output_dir, lang, jobs_values, repeat, sparse=False):
+    """Full download_repo runs against the local server, without caches, with the stage breakdown of the last run."""
+    results = {}
+    for jobs in jobs_values:
+        stats = None
+
+        def run():
+            nonlocal stats
+            stats = github2file.RunStats()
+            with contextlib.redirect_stdout(io.StringIO()):
+                github2file.download_repo(f"{base_url}/github.com/bench/bench", output_dir, lang, jobs=jobs, sparse=sparse, stats=stats)
+        result = time_call(run, repeat)
+        result["stats"] = stats.to_dict()
+        results[f"jobs_{jobs}"] = result
+    return results
+
+def sample_contents(zip_file, lang, sample, seed):
+    """Decompress up to sample files: candidates of lang for classification, and sources per extension for stripping."""
+    rng = random.Random(seed)
+    names = [name for name in zip_file.namelist() if not name.endswith("/")]
+    rng.shuffle(names)
+    extensions = tuple(LANGUAGE_EXTENSIONS.values())
+    path_filter = github2file.PathFilter(lang)
+    candidates, by_extension = [], {}
+    for name in names[:sample]:
+        content = zip_file.read(name).decode("utf-8", errors="replace")
+        if path_filter(name):
+            candidates.append(content)
+        if name.endswith(extensions) and "node_modules/" not in name:
+            by_extension.setdefault(os.path.splitext(name)[1], []).append(content)
+    return candidates, by_extension
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip() or None
+    except FileNotFoundError:
+        return None
+
+def compare_results(old, new, path=""):
+    """Print the best times of two result files side by side with the relative change."""
+    for key, value in new.items():
+        if key == "stats" or not isinstance(value, dict):
+            continue
+        if "best_seconds" in value and isinstance(old.get(key), dict) and "best_seconds" in old[key]:
+            before, after = old[key]["best_seconds"], value["best_seconds"]
+            change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+            print(f"  {path + key:<45} {before:10.4f}s -> {after:10.4f}s  {change}")
+        elif isinstance(old.get(key), dict):
+            compare_results(old[key], value, path + key + ".")
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark github2file on synthetic repository archives served from a local HTTP server.')
+    parser.add_argument('--files', type=int, help='Number of source files in the synthetic repository', default=1000)
+    parser.add_argument('--mix', type=str, help='Language mix as language=weight pairs', default=DEFAULT_MIX)
+    parser.add_argument('--node-modules', type=int, help='Number of files in a nested node_modules tree', default=0)
+    parser.add_argument('--vendor', type=int, help='Number of files in a vendor tree', default=0)
+    parser.add_argument('--minified', type=int, help='Number of huge minified bundles and generated tables', default=0)
+    parser.add_argument('--syntax-errors', type=int, help='Number of Python files with syntax errors', default=0)
+    parser.add_argument('--seed', type=int, help='Seed of the archive generator', default=0)
+    parser.add_argument('--lang', type=str, choices=['go', 'python', 'md'], default='python', help='Language processed by the end-to-end runs')
+    parser.add_argument('--jobs', type=str, help='Comma-separated --jobs values for the end-to-end runs', default="1")
+    parser.add_argument('--sparse', action='store_true', help='Run the end-to-end benchmark with sparse range downloads')
+    parser.add_argument('--repeat', type=int, help='Number of timed repetitions; the best and median are reported', default=3)
+    parser.add_argument('--sample', type=int, help='Number of files decompressed for the per-stage benchmarks', default=DEFAULT_SAMPLE)
+    parser.add_argument('--work-dir', type=str, help='Directory for the generated archives and output', default=DEFAULT_WORK_DIR)
+    parser.add_argument('--output', type=str, help='Write the results as JSON to this file', default=None)
+    parser.add_argument('--compare', type=str, help='Compare the results with an earlier JSON results file', default=None)
+
+    args = parser.parse_args()
+    shape = {"files": args.files, "mix": args.mix, "node_modules": args.node_modules, "vendor": args.vendor,
+             "minified": args.minified, "syntax_errors": args.syntax_errors, "seed": args.seed}
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Archives are generated once per shape and reused, so that runs on different commits read identical input
+    shape_id = hashlib.sha256(json.dumps(shape, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    serve_dir = os.path.join(args.work_dir, shape_id)
+    archive_dir = os.path.join(serve_dir, "github.com", "bench", "bench", "archive", "refs", "heads")
+    archive_path = os.path.join(archive_dir, "main.zip")
+    if not os.path.exists(archive_path):
+        os.makedirs(archive_dir, exist_ok=True)
+        print(f"Generating {archive_path}")
+        started = time.perf_counter()
+        generate_archive(archive_path + ".part", **shape)
+        os.replace(archive_path + ".part", archive_path)
+        print(f"Generated in {time.perf_counter() - started:.1f}s")
+
+    results = {"commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+               "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "shape": shape, "archive_bytes": os.path.getsize(archive_path), "stages": {}}
+    with zipfile.ZipFile(archive_path) as zip_file:
+        names = zip_file.namelist()
+        candidates, by_extension = sample_contents(zip_file, args.lang, args.sample, args.seed)
+    print("Benchmarking path filtering")
+    results["stages"]["path_filter"] = bench_path_filter(names, args.lang, args.repeat)
+    print("Benchmarking content classification")
+    results["stages"]["classification"] = bench_classification(candidates, args.lang, args.repeat)
+    print("Benchmarking comment stripping")
+    results["stages"]["comment_stripping"] = bench_stripping(by_extension, args.repeat)
+    print("Benchmarking output writing")
+    results["stages"]["output_writing"] = bench_writing(candidates, args.repeat)
+    print("Benchmarking end-to-end runs")
+    output_dir = os.path.join(args.work_dir, "output")
+    os.makedirs(output_dir, exist_ok=True)
+    with serve_directory(serve_dir) as base_url:
+        jobs_values = [int(jobs) for jobs in args.jobs.split(",")]
+        results["end_to_end"] = bench_end_to_end(base_url, output_dir, args.lang, jobs_values, args.repeat, args.sparse)
+
+    summary = {key: value for key, value in results.items() if key != "end_to_end"}
+    summary["end_to_end"] = {jobs: {key: value for key, value in result.items() if key != "stats"} for jobs, result in results["end_to_end"].items()}
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"Results saved to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as compare_file:
+            previous = json.load(compare_file)
+        print(f"Compared with {args.compare} (commit {previous.get('commit')}):")
+        compare_results(previous, results)
@@ -1,94 +1,43 @@
 import os
-import sys
-import requests
-import zipfile
-import io
-import ast
+import queue
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, font, ttk
-
-def is_python_file(file_path):
-    """Check if the file is a Python file."""
-    return file_path.endswith(".py")
-
-def is_likely_useful_file(file_path):
-    """Determine if the file is likely to be useful by excluding certain directories and specific file types."""
-    excluded_dirs = ["docs", "examples", "tests", "test", "__pycache__", "scripts", "utils", "benchmarks"]
-    utility_or_config_files = ["hubconf.py", "setup.py"]
-    github_workflow_or_docs = ["stale.py", "gen-card-", "write_model_card"]
-
-    if any(part.startswith('.') for part in file_path.split('/')):
-        return False
-
-    if 'test' in file_path.lower():
-        return False
-
-    for excluded_dir in excluded_dirs:
-        if f"/{excluded_dir}/" in file_path or file_path.startswith(excluded_dir + "/"):
-            return False
-
-    for file_name in utility_or_config_files:
-        if file_name in file_path:
-            return False
-
-    for doc_file in github_workflow_or_docs:
-        if doc_file in file_path:
-            return False
-
-    return True
-
-def is_test_file(file_content):
-    """Determine if the file content suggests it is a test file."""
-    test_indicators = ["import unittest", "import pytest", "from unittest", "from pytest"]
-    return any(indicator in file_content for indicator in test_indicators)
-
-def has_sufficient_content(file_content, min_line_count=10):
-    """Check if the file has a minimum number of substantive lines."""
-    lines = [line for line in file_content.split('\n') if line.strip() and not line.strip().startswith('#')]
-    return len(lines) >= min_line_count
-
-def remove_comments_and_docstrings(source):
-    """Remove comments and docstrings from the Python source code."""
-    tree = ast.parse(source)
-    for node in ast.walk(tree):
-        if isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.AsyncFunctionDef)) and ast.get_docstring(node):
-            node.body = node.body[1:]  # Remove docstring
-        elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Str):
-            node.value.s = ""  # Remove comments
-
-    return ast.unparse(tree)
-
-def download_repo(repo_url, output_file):
-    """Download and process files from a GitHub repository."""
-    response = requests.get(repo_url + "/archive/master.zip")
-    zip_file = zipfile.ZipFile(io.BytesIO(response.content))
-
-    with open(output_file, "w", encoding="utf-8") as outfile:
-        for file_path in zip_file.namelist():
-            # Skip directories, non-Python files, less likely useful files, hidden directories, and test files
-            if file_path.endswith("/") or not is_python_file(file_path) or not is_likely_useful_file(file_path):
-                continue
-
-            file_content = zip_file.read(file_path).decode("utf-8")
-
-            # Skip test files based on content and files with insufficient substantive content
-            if is_test_file(file_content) or not has_sufficient_content(file_content):
-                continue
-
-            try:
-                file_content = remove_comments_and_docstrings(file_content)
-            except SyntaxError:
-                # Skip files with syntax errors
-                continue
-
-            outfile.write(f"# File: {file_path}\n")
-            outfile.write(file_content)
-            outfile.write("\n\n")
+from github2file import download_repo, DownloadError, ArchiveCache, TransformCache, DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE, DEFAULT_TRANSFORM_CACHE_SIZE
+
+POLL_INTERVAL_MS = 100
+
+class Cancelled(Exception):
+    """Raised from the progress callback to stop the download when Cancel is pressed."""
+
+def run_download(repo_url, branch_or_tag, lang, output_path, events, cancel_event):
+    """
+    Download and process a repository on a worker thread, reporting to the GUI through the events queue.
+    Progress is posted as ("progress", stage, done, total), followed by exactly one ("done", output_file),
+    ("cancelled",) or ("error", message).
+    """
+    def report(stage, done, total):
+        if cancel_event.is_set():
+            raise Cancelled()
+        events.put(("progress", stage, done, total))
+
+    try:
+        cache = ArchiveCache(DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE)
+        transform_cache = TransformCache(DEFAULT_CACHE_DIR, DEFAULT_TRANSFORM_CACHE_SIZE)
+        output_file = download_repo(repo_url, os.path.dirname(output_path) or ".", lang, branch_or_tag=branch_or_tag, cache=cache,
+                                    transform_cache=transform_cache, output_path=output_path, progress=report)
+        events.put(("done", output_file))
+    except Cancelled:
+        events.put(("cancelled",))
+    except DownloadError as e:
+        events.put(("error", str(e)))
+    except Exception as e:
+        events.put(("error", f"{type(e).__name__}: {e}"))
 
 def main():
     root = tk.Tk()
     root.title("GitHub Repo Downloader")
-    root.geometry("500x140")  # Make the window 10% shorter
+    root.geometry("500x250")
     root.configure(bg="#1c1c1c")  # Set the background color to a dark shade
 
     # Custom font
@@ -100,25 +49,84 @@ def main():
     style.configure("TButton", padding=6, relief="flat", background="#00d0ff", foreground="#1c1c1c", font=custom_font)
     style.map("TButton", background=[("active", "#00a0c0")])
 
+    events = queue.Queue()
+    cancel_event = threading.Event()
+
+    def show_progress(stage, done, total):
+        if total:
+            progress_bar.configure(mode="determinate", maximum=total, value=done)
+        else:
+            progress_bar.configure(mode="indeterminate")
+            progress_bar.step(2)
+        if stage == "download":
+            status_label.configure(text=f"Downloading: {done / (1024 * 1024):.1f} MB")
+        else:
+            status_label.configure(text=f"Processing: {done} / {total} files")
+
+    def finish(message):
+        progress_bar.configure(mode="determinate", value=0)
+        download_button.configure(state=tk.NORMAL)
+        save_button.configure(state=tk.NORMAL)
+        cancel_button.configure(state=tk.DISABLED)
+        if message[0] == "done":
+            status_label.configure(text="Done")
+            messagebox.showinfo("Success", f"Combined {lang_box.get().capitalize()} source code saved to {message[1]}", parent=root)
+        elif message[0] == "cancelled":
+            status_label.configure(text="Cancelled")
+        else:
+            status_label.configure(text="Failed")
+            messagebox.showerror("Error", message[1], parent=root)
+
+    def poll():
+        # Only the latest progress update is drawn; the worker may post many between two polls
+        latest, result = None, None
+        try:
+            while result is None:
+                message = events.get_nowait()
+                if message[0] == "progress":
+                    latest = message
+                else:
+                    result = message
+        except queue.Empty:
+            pass
+        if latest:
+            show_progress(*latest[1:])
+        if result:
+            finish(result)
+        else:
+            root.after(POLL_INTERVAL_MS, poll)
+
+    def start(output_path):
+        cancel_event.clear()
+        download_button.configure(state=tk.DISABLED)
+        save_button.configure(state=tk.DISABLED)
+        cancel_button.configure(state=tk.NORMAL)
+        status_label.configure(text="Connecting...")
+        worker = threading.Thread(target=run_download, args=(repo_entry.get(), branch_entry.get() or "main", lang_box.get(), output_path, events, cancel_event), daemon=True)
+        worker.start()
+        root.after(POLL_INTERVAL_MS, poll)
+
     def browse_repo():
         repo_url = repo_entry.get()
         if repo_url:
-            repo_name = repo_url.split("/")[-1]
-            output_file = f"{repo_name}_python.txt"
-            download_repo(repo_url, output_file)
-            messagebox.showinfo("Success", f"Combined Python source code saved to {output_file}", parent=root)
+            repo_name = repo_url.rstrip("/").split("/")[-1]
+            start(f"{repo_name}_{lang_box.get()}.txt")
         else:
             messagebox.showerror("Error", "Please enter a valid GitHub repository URL.", parent=root)
 
     def browse_file():
+        repo_url = repo_entry.get()
+        if not repo_url:
+            messagebox.showerror("Error", "Please enter a valid GitHub repository URL.", parent=root)
+            return
         file_path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text Files", "*.txt")], parent=root)
         if file_path:
-            repo_url = repo_entry.get()
-            if repo_url:
-                download_repo(repo_url, file_path)
-                messagebox.showinfo("Success", f"Combined Python source code saved to {file_path}", parent=root)
-            else:
-                messagebox.showerror("Error", "Please enter a valid GitHub repository URL.", parent=root)
+            start(file_path)
+
+    def cancel():
+        cancel_event.set()
+        cancel_button.configure(state=tk.DISABLED)
+        status_label.configure(text="Cancelling...")
 
     repo_label = tk.Label(root, text="GitHub Repository URL:", font=custom_font, fg="#00d0ff", bg="#1c1c1c")  # Light blue text on dark background
     repo_label.pack(pady=10)
@@ -126,6 +134,19 @@ def main():
     repo_entry = tk.Entry(root, width=40, font=custom_font, bg="#333333", fg="#ffffff")  # Light text on dark background
     repo_entry.pack()
 
+    options_frame = tk.Frame(root, bg="#1c1c1c")
+    options_frame.pack(pady=5)
+
+    tk.Label(options_frame, text="Branch:", font=custom_font, fg="#00d0ff", bg="#1c1c1c").pack(side=tk.LEFT)
+    branch_entry = tk.Entry(options_frame, width=12, font=custom_font, bg="#333333", fg="#ffffff")
+    branch_entry.insert(0, "main")
+    branch_entry.pack(side=tk.LEFT, padx=5)
+
+    tk.Label(options_frame, text="Language:", font=custom_font, fg="#00d0ff", bg="#1c1c1c").pack(side=tk.LEFT)
+    lang_box = ttk.Combobox(options_frame, values=["python", "go", "md"], width=8, state="readonly")
+    lang_box.set("python")
+    lang_box.pack(side=tk.LEFT, padx=5)
+
     button_frame = tk.Frame(root, bg="#1c1c1c")  # Dark background for the button frame
     button_frame.pack(pady=10)
 
@@ -135,6 +156,15 @@ def main():
     save_button = ttk.Button(button_frame, text="Save As...", command=browse_file)
     save_button.pack(side=tk.LEFT)
 
+    cancel_button = ttk.Button(button_frame, text="Cancel", command=cancel, state=tk.DISABLED)
+    cancel_button.pack(side=tk.LEFT, padx=10)
+
+    progress_bar = ttk.Progressbar(root, length=440, mode="determinate")
+    progress_bar.pack()
+
+    status_label = tk.Label(root, text="", font=custom_font, fg="#ffffff", bg="#1c1c1c")
+    status_label.pack(pady=5)
+
     root.mainloop()
 
 if __name__ == "__main__":
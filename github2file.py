@@ -5,8 +5,82 @@ import zipfile
 import io
 import ast
 import argparse
+import tempfile
+import struct
+import zlib
+import bz2
+import collections
+import concurrent.futures
+import hashlib
+import json
+import time
+import urllib.parse
+import sqlite3
+import threading
+import re
+import bisect
+import tokenize
+import subprocess
+import mmap
+import heapq
+import itertools
+import contextlib
+import cProfile
+import multiprocessing
+import asyncio
+from http import HTTPStatus
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import List
 
+DEFAULT_MAX_MEMORY = 32 * 1024 * 1024  # Archives larger than this are spooled to a temporary file
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+WORKER_BATCH_BYTES = 256 * 1024  # Compressed bytes handed to a worker process per task
+WORKER_BATCH_FILES = 64
+LOCAL_FILE_HEADER = struct.Struct("<4s2B4HL2L2H")
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "github2file")
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+DEFAULT_TRANSFORM_CACHE_SIZE = 256 * 1024 * 1024
+TRANSFORM_CACHE_BATCH = 64  # Entries written per transaction; the database is only locked while a batch is written
+TRANSFORM_VERSION = "4"  # Bump whenever the filters or comment stripping change their output
+DEFAULT_CONCURRENCY = 8
+SPARSE_TAIL_SIZE = 1024 * 1024  # Fetched first in sparse mode; usually covers the whole central directory
+SPARSE_MIN_FETCH = 64 * 1024
+SPARSE_COALESCE_GAP = 64 * 1024  # Member ranges closer than this may be fetched with a single request...
+SPARSE_MAX_WASTE = 0.25  # ...as long as the skipped bytes in between stay under this fraction of the member bytes
+DEFAULT_MAX_FILE_SIZE = 1024 * 1024  # Larger files are minified bundles, data dumps or generated code
+DEFAULT_MAX_COMPRESSION_RATIO = 12  # Source code compresses 3-6x; far higher ratios mean generated tables
+COMPRESSION_RATIO_MIN_SIZE = 64 * 1024
+GENERATED_FILE_SUFFIXES = (".min.js", ".bundle.js", ".pb.go", ".pb.gw.go", "_pb2.py", "_pb2_grpc.py", ".generated.ts", "_generated.go")
+TEST_INDICATORS = {
+    "python": ["import unittest", "import pytest", "from unittest", "from pytest"],
+    "go": ["import testing", "func Test"]
+}
+DEFAULT_RETRIES = 3
+DEFAULT_TIMEOUT = 30  # Seconds to connect, and between bytes received, before a download is abandoned
+INDEX_BLOCK_SIZE = 256 * 1024  # Uncompressed bytes per gzip member of a compressed output; smaller seeks faster, compresses worse
+INDEX_READ_CHUNK = 64 * 1024
+DEFAULT_TOP_FILES = 10  # Slowest files listed in the run stats
+LOCAL_MMAP_THRESHOLD = 1024 * 1024  # Local files at least this large are checksummed through mmap instead of read
+BYTES_PER_TOKEN = 4  # Rough average for source code with common LLM tokenizers
+GITHUB_HOSTS = frozenset(["github.com", "www.github.com"])
+GITLAB_HOSTS = frozenset(["gitlab.com", "www.gitlab.com"])
+DEFAULT_ALLOWED_HOSTS = GITHUB_HOSTS | GITLAB_HOSTS  # Hosts --serve fetches repositories from
+DEFAULT_SERVER_HOST = "127.0.0.1"
+DEFAULT_SERVER_PORT = 8080
+DEFAULT_SERVER_QUEUE_SIZE = 16  # Jobs waiting for a free worker before requests are turned away with 503
+DEFAULT_RESULT_CACHE_SIZE = 256 * 1024 * 1024
+DEFAULT_RESULT_CACHE_TTL = 300
+SERVER_FLUSH_SIZE = 64 * 1024  # Output bytes collected on the worker thread before they are handed to the event loop
+SERVER_REQUEST_TIMEOUT = 30
+SERVER_MAX_HEADERS = 100
+SERVER_MAX_PATTERNS = 32  # include plus exclude patterns accepted in one request
+SERVER_MAX_PATTERN_LENGTH = 256
+SERVER_MAX_REPLAY = 64 * 1024 * 1024  # Output bytes a job keeps so that requests joining late get it from the start
+UMASK = os.umask(0o022)  # Read back at once; applied to the output files that open_part_file creates
+os.umask(UMASK)
+ENTRYPOINT_NAMES = frozenset(["main", "__main__", "__init__", "index", "app", "cli", "server", "lib", "mod", "setup"])
+
 def get_language_extensions(language: str) -> List[str]:
     """Return a list of file extensions for the specified programming language."""
     language_extensions = {
@@ -24,8 +98,8 @@ def is_file_type(file_path: str, language: str) -> bool:
     extensions = get_language_extensions(language)
     return any(file_path.endswith(ext) for ext in extensions)
 
-def is_likely_useful_file(file_path, lang):
-    """Determine if the file is likely useful by applying various filters."""
+def get_path_filter_rules(lang):
+    """Return the excluded directories, utility/config files and workflow/docs markers used to filter paths."""
     excluded_dirs = ["examples", "tests", "test", "scripts", "utils", "benchmarks"]
     utility_or_config_files = []
     workflow_or_docs = [".github", ".gitlab-ci.yml", ".gitignore", "LICENSE", "README"]
@@ -37,6 +111,11 @@ def is_likely_useful_file(file_path, lang):
     elif lang == "go":
         excluded_dirs.append("vendor")
         utility_or_config_files.extend(["go.mod", "go.sum", "Makefile"])
+    return excluded_dirs, utility_or_config_files, workflow_or_docs
+
+def is_likely_useful_file(file_path, lang):
+    """Determine if the file is likely useful by applying various filters."""
+    excluded_dirs, utility_or_config_files, workflow_or_docs = get_path_filter_rules(lang)
 
     if any(part.startswith('.') for part in file_path.split('/')):
         return False
@@ -53,13 +132,135 @@ def is_likely_useful_file(file_path, lang):
             return False
     return True
 
+_GLOB_GROUPS = itertools.count()  # Group names must be unique across the patterns joined into one regular expression
+
+def _atomic(regex):
+    """Match regex once, at its first match, without ever backtracking into it (a lookahead and a backreference emulate an atomic group)."""
+    group = f"g{next(_GLOB_GROUPS)}"
+    return f"(?=(?P<{group}>{regex}))(?P={group})"
+
+def _glob_segment_regex(segment):
+    """
+    Translate one path segment of a glob; '*' matches within the segment. Like fnmatch.translate, the parts between
+    two '*' are matched at their leftmost occurrence, which is always a match if there is one.
+    """
+    parts, current, i = [], "", 0
+    while i < len(segment):
+        if segment[i] == "*":
+            parts.append(current)
+            current = ""
+            while i < len(segment) and segment[i] == "*":
+                i += 1
+            continue
+        if segment[i] == "?":
+            current += "[^/]"
+        elif segment[i] == "[" and "]" in segment[i + 2:]:
+            end = segment.index("]", i + 2)
+            char_class = segment[i + 1:end].replace("\\", "\\\\")
+            current += "[" + ("^/" + char_class[1:] if char_class.startswith("!") else char_class) + "]"
+            i = end
+        else:
+            current += re.escape(segment[i])
+        i += 1
+    if not parts:
+        return current
+    return parts[0] + "".join(_atomic(f"[^/]*?{part}") for part in parts[1:]) + "[^/]*" + current
+
+def glob_to_regex(pattern):
+    """
+    Translate a .gitignore-style pattern into a regular expression matched against repository-relative paths.
+    A pattern also matches everything below a matching directory; patterns without a slash match at any depth,
+    a trailing slash restricts the pattern to directories, and a '**' segment matches any number of directories
+    ('**' within a segment is a plain '*', as in .gitignore). The segments between two '**' are matched at their
+    leftmost occurrence, like the parts between two '*' (see _glob_segment_regex), so that no pattern can make
+    matching backtrack through every way of splitting a path.
+    """
+    dir_only = pattern.endswith("/")
+    anchored = "/" in pattern.rstrip("/")
+    segments = pattern.strip("/").split("/")
+    suffix = "/.*" if dir_only else "(?:/.*)?"
+    if segments[-1] == "**":
+        suffix = "/.*/.*" if dir_only else "/.*"
+    starts_anywhere = not anchored or segments[0] == "**"
+    # Runs of directories between '**' segments; consecutive '**' match no more than one
+    blocks = [[]]
+    for segment in segments:
+        if segment == "**":
+            blocks.append([])
+        else:
+            blocks[-1].append(_glob_segment_regex(segment))
+    blocks = [block for block in blocks if block]
+    if not blocks:
+        return ".*/.*" if dir_only else ".*"
+    regex = ""
+    for index, block in enumerate(blocks):
+        block_regex = "/".join(block)
+        floating = index > 0 or starts_anywhere
+        if index == len(blocks) - 1:
+            regex += ("(?:[^/]*/)*" if floating else "") + block_regex
+        elif floating:
+            regex += _atomic(f"(?:[^/]*/)*?{block_regex}/")
+        else:
+            regex += block_regex + "/"
+    return regex + suffix
+
+def read_rules_file(rules_path):
+    """Read a .gitignore-style rules file into a list of patterns, skipping blank lines and comments."""
+    with open(rules_path, encoding="utf-8") as rules_file:
+        return [line.strip() for line in rules_file if line.strip() and not line.startswith("#")]
+
+class PathFilter:
+    """
+    Path filter compiled once per run from the rules of get_path_filter_rules, with the same decisions as
+    is_file_type and is_likely_useful_file combined. Optional include/exclude globs and .gitignore-style
+    rules (with '!' negation) are applied on top, relative to root_prefix (the archive's top-level folder).
+    """
+
+    def __init__(self, lang, include=None, exclude=None, rules=None, root_prefix=""):
+        excluded_dirs, utility_or_config_files, workflow_or_docs = get_path_filter_rules(lang)
+        self.extensions = tuple(get_language_extensions(lang))
+        self.excluded_dirs = frozenset(excluded_dirs)
+        self.excluded_substrings = re.compile("|".join(re.escape(marker) for marker in utility_or_config_files + workflow_or_docs))
+        self.root_prefix = root_prefix
+        self.include = re.compile("|".join(f"(?:{glob_to_regex(pattern)})" for pattern in include)) if include else None
+        # Rules are evaluated last match first, like .gitignore; exclude globs always win
+        self.rules = [(re.compile(glob_to_regex(rule[1:] if rule.startswith("!") else rule)), rule.startswith("!"))
+                      for rule in reversed(rules or [])]
+        self.exclude = re.compile("|".join(f"(?:{glob_to_regex(pattern)})" for pattern in exclude)) if exclude else None
+
+    def __call__(self, file_path):
+        """Return True if the file at file_path should be processed."""
+        if file_path.endswith("/") or not file_path.endswith(self.extensions):
+            return False
+        parts = file_path.split("/")
+        if any(part.startswith(".") for part in parts) or "test" in file_path.lower():
+            return False
+        if not self.excluded_dirs.isdisjoint(parts[:-1]) or self.excluded_substrings.search(file_path):
+            return False
+
+        if self.include is None and self.exclude is None and not self.rules:
+            return True
+        relative_path = file_path[len(self.root_prefix):] if file_path.startswith(self.root_prefix) else file_path
+        if self.include is not None and not self.include.fullmatch(relative_path):
+            return False
+        if self.exclude is not None and self.exclude.fullmatch(relative_path):
+            return False
+        for rule, negated in self.rules:
+            if rule.fullmatch(relative_path):
+                return negated
+        return True
+
+def get_archive_root(zip_file):
+    """Return the top-level folder shared by every entry of the archive (e.g. 'repo-main/'), or '' if there is none."""
+    names = zip_file.namelist()
+    if not names or "/" not in names[0]:
+        return ""
+    root = names[0].split("/", 1)[0] + "/"
+    return root if all(name.startswith(root) for name in names) else ""
+
 def is_test_file(file_content, lang):
     """Determine if the file content suggests it is a test file."""
-    test_indicators = {
-        "python": ["import unittest", "import pytest", "from unittest", "from pytest"],
-        "go": ["import testing", "func Test"]
-    }
-    indicators = test_indicators.get(lang, [])
+    indicators = TEST_INDICATORS.get(lang, [])
     return any(indicator in file_content for indicator in indicators)
 
 def has_sufficient_content(file_content, min_line_count=10):
@@ -67,16 +268,393 @@ def has_sufficient_content(file_content, min_line_count=10):
     lines = [line for line in file_content.split('\n') if line.strip() and not line.strip().startswith(('#', '//'))]
     return len(lines) >= min_line_count
 
+_test_indicator_patterns = {lang: re.compile("|".join(re.escape(indicator) for indicator in indicators)) for lang, indicators in TEST_INDICATORS.items()}
+
+def is_substantive_file(file_content, lang, min_line_count=10):
+    """
+    Equivalent to `not is_test_file(...) and has_sufficient_content(...)` in a single pass:
+    line counting stops as soon as min_line_count substantive lines are found, and the test
+    indicators are searched with one compiled pattern instead of one scan per indicator.
+    """
+    count, start = 0, 0
+    while count < min_line_count:
+        end = file_content.find("\n", start)
+        line = file_content[start:] if end == -1 else file_content[start:end]
+        line = line.strip()
+        if line and not line.startswith(("#", "//")):
+            count += 1
+        if end == -1:
+            break
+        start = end + 1
+    if count < min_line_count:
+        return False
+    pattern = _test_indicator_patterns.get(lang)
+    return pattern is None or pattern.search(file_content) is None
+
+class MetadataFilter:
+    """
+    Pre-filter on ZipInfo metadata that rejects oversized and clearly generated files before they are decompressed.
+    The number of skipped files and the uncompressed bytes that were never inflated are counted for the run stats.
+    """
+
+    def __init__(self, max_file_size=DEFAULT_MAX_FILE_SIZE, max_compression_ratio=DEFAULT_MAX_COMPRESSION_RATIO):
+        self.max_file_size = max_file_size
+        self.max_compression_ratio = max_compression_ratio
+        self.skipped_files = 0
+        self.skipped_bytes = 0
+
+    def __call__(self, info):
+        """Return True if the archive entry should be decompressed and processed."""
+        if (self.max_file_size and info.file_size > self.max_file_size) or info.filename.endswith(GENERATED_FILE_SUFFIXES) or (
+                self.max_compression_ratio and info.file_size >= COMPRESSION_RATIO_MIN_SIZE
+                and info.file_size > self.max_compression_ratio * max(info.compress_size, 1)):
+            self.skipped_files += 1
+            self.skipped_bytes += info.file_size
+            return False
+        return True
+
+def strip_python_comments(source):
+    """
+    Remove comments and docstrings from Python source code in a single tokenize pass, keeping the original formatting.
+    Unlike remove_comments_and_docstrings, the source does not need to parse (e.g. Python 2 code), only to tokenize.
+    Docstrings and other bare string statements are dropped; a block left empty by that gets a `pass`.
+    """
+    lines = io.StringIO(source).readlines()
+    drop_lines = set()
+    trims = {}  # row -> column where a trailing comment starts
+    replacements = {}  # row -> replacement for a block that would otherwise be left empty
+    blocks = []  # For each open indented block: [has a kept statement, first row of a dropped statement]
+
+    statement = []  # Significant tokens of the current logical line
+    for token in tokenize.generate_tokens(io.StringIO(source).readline):
+        if token.type == tokenize.COMMENT:
+            row, col = token.start
+            if lines[row - 1][:col].strip():
+                trims[row] = col
+            else:
+                drop_lines.add(row)
+        elif token.type == tokenize.INDENT:
+            blocks.append([False, None])
+        elif token.type == tokenize.DEDENT:
+            kept, first_dropped_row = blocks.pop()
+            if not kept and first_dropped_row is not None:
+                replacements[first_dropped_row] = "pass"
+        elif token.type == tokenize.NEWLINE:
+            # f-strings are evaluated, so only plain string statements are safe to drop
+            if statement and all(tok.type == tokenize.STRING and "f" not in tok.string[:tok.string.index(tok.string[-1])].lower()
+                                 for tok in statement):
+                drop_lines.update(range(statement[0].start[0], token.end[0] + 1))
+                if blocks and blocks[-1][1] is None:
+                    blocks[-1][1] = statement[0].start[0]
+            elif blocks:
+                blocks[-1][0] = True
+            statement = []
+        elif token.type not in (tokenize.NL, tokenize.ENDMARKER):
+            statement.append(token)
+
+    output = []
+    for row, line in enumerate(lines, start=1):
+        if row in replacements:
+            indent = line[:len(line) - len(line.lstrip())]
+            output.append(f"{indent}pass\n")
+        elif row in drop_lines:
+            continue
+        elif row in trims:
+            output.append(line[:trims[row]].rstrip() + line[len(line.rstrip("\r\n")):])
+        else:
+            output.append(line)
+    return "".join(output)
+
+def strip_python_source(file_path, source):
+    """
+    Strip comments and docstrings from a Python file, falling back per file from the tokenize stripper to
+    the AST-based one, and to the unchanged source if neither can handle it (source itself is returned then).
+    """
+    try:
+        return strip_python_comments(source)
+    except (tokenize.TokenError, SyntaxError):
+        pass
+    try:
+        return remove_comments_and_docstrings(source)
+    except (SyntaxError, ValueError):
+        print(f"Warning: Keeping comments in {file_path} because it could not be tokenized or parsed.")
+        return source
+
+# Token patterns for the comment strippers. Every alternative either always matches and consumes what it scanned,
+# or fails within a char literal, so scanning stays linear in the size of the file however long its lines are.
+_LINE_COMMENT = r"(?P<line_comment>//[^\r\n]*)"
+_BLOCK_COMMENT = r"(?P<block_comment>/\*(?:.*?\*/|.*))"
+_DOUBLE_QUOTED = r'(?P<string>"(?:[^"\\\n]|\\.)*"?)'
+_SINGLE_QUOTED = r"(?P<char>'(?:[^'\\\n]|\\.)*'?)"
+LEXER_PATTERNS = {
+    "javascript": re.compile("|".join([_LINE_COMMENT, _BLOCK_COMMENT, _DOUBLE_QUOTED, _SINGLE_QUOTED, r"(?P<template>`)", r"(?P<slash>/)"]), re.S),
+    "go": re.compile("|".join([_LINE_COMMENT, _BLOCK_COMMENT, _DOUBLE_QUOTED, _SINGLE_QUOTED, r"(?P<raw_string>`[^`]*`?)"]), re.S),
+    "java": re.compile("|".join([_LINE_COMMENT, _BLOCK_COMMENT, r'(?P<text_block>"""(?:\\.|[^\\])*?(?:"""|\Z))', _DOUBLE_QUOTED, _SINGLE_QUOTED]), re.S),
+    "rust": re.compile("|".join([_LINE_COMMENT, r"(?P<nested_comment>/\*)", r'(?P<rust_raw_string>\bb?r(?P<hashes>#*)")',
+                                 r'(?P<string>"(?:[^"\\]|\\.)*"?)', r"(?P<char>'(?:\\(?:x[0-9a-fA-F]{2}|u\{[0-9a-fA-F]{1,6}\}|.)|[^\\'\n])')"]), re.S),
+    "css": re.compile("|".join([_BLOCK_COMMENT, _DOUBLE_QUOTED, _SINGLE_QUOTED]), re.S),
+}
+# Inside a template literal substitution the braces are tokens too, to find the '}' that closes it
+_JS_SUBSTITUTION_PATTERN = re.compile(LEXER_PATTERNS["javascript"].pattern + r"|(?P<brace>[{}])", re.S)
+_JS_TEMPLATE_PART = re.compile(r"\\.|`|\$\{", re.S)
+_JS_REGEX_FLAGS = re.compile(r"[A-Za-z]*")
+_JS_WORD_BEFORE = re.compile(r"[\w$]+\Z")
+_JS_KEYWORDS_BEFORE_REGEX = frozenset(["return", "typeof", "instanceof", "in", "of", "new", "delete", "void", "throw", "case", "do", "else", "yield", "await"])
+_RUST_BLOCK_COMMENT_PART = re.compile(r"/\*|\*/")
+_SVELTE_SECTION_START = re.compile(r"<(script|style)\b|<!--", re.I)
+_SVELTE_SECTION_END = {"script": re.compile(r"</script\s*>", re.I), "style": re.compile(r"</style\s*>", re.I)}
+_GO_DIRECTIVE = re.compile(r"//(?:go:|line |export |extern | \+build)")
+_GO_IMPORT_C = re.compile(r'import[ \t]+"C"')
+_WHITESPACE = re.compile(r"\s*")
+
+def _js_slash_starts_regex(source, slash_pos):
+    """Decide whether a '/' in JavaScript code starts a regular expression literal rather than a division."""
+    i = slash_pos - 1
+    while i >= 0 and source[i] in " \t\r\n":
+        i -= 1
+    if i < 0:
+        return True
+    previous = source[i]
+    if previous.isalnum() or previous in "_$":
+        word = _JS_WORD_BEFORE.search(source, max(0, i - 20), i + 1)
+        if word is None or word.group() not in _JS_KEYWORDS_BEFORE_REGEX:
+            return False
+        # A keyword used as a property name (y.return / 2) is an operand
+        i = word.start() - 1
+        while i >= 0 and source[i] in " \t\r\n":
+            i -= 1
+        return i < 0 or source[i] != "."
+    return previous not in ")]"
+
+def _js_regex_end(source, start, failed):
+    """
+    Return the end of the regular expression literal whose opening '/' is at start, or None if the line ends first.
+    failed marks, per position, whether an earlier attempt reached the end of the line from there outside (1) or
+    inside (2) a character class; an attempt reaching such a state fails too, so no state is scanned twice.
+    """
+    pos, in_class, visited = start + 1, False, []
+    while pos < len(source):
+        state = 2 if in_class else 1
+        if failed[pos] & state:
+            break
+        visited.append((pos, state))
+        char = source[pos]
+        if char == "\n":
+            break
+        if char == "\\":
+            if source[pos + 1:pos + 2] in ("", "\n"):
+                break
+            pos += 2
+            continue
+        if in_class:
+            in_class = char != "]"
+        elif char == "/":
+            return _JS_REGEX_FLAGS.match(source, pos + 1).end()
+        elif char == "[":
+            in_class = True
+        pos += 1
+    for pos, state in visited:
+        failed[pos] |= state
+    return None
+
+def _scan_comments(source, language, pos, comments):
+    """
+    Scan source from pos, appending the (start, end) span of every comment to comments.
+    JavaScript template literals and the ${...} substitutions in them nest to any depth: the brace depth of every
+    open substitution is kept on an explicit stack instead of recursing into it.
+    """
+    regex_failures = bytearray(len(source)) if language == "javascript" else None
+    substitutions = []  # Brace depth outside each open substitution, innermost last
+    depth = 0
+    in_template = False
+    while True:
+        if in_template:
+            part = _JS_TEMPLATE_PART.search(source, pos)
+            if part is None:
+                return
+            pos = part.end()
+            if part.group() == "`":
+                in_template = False
+            elif part.group() == "${":
+                substitutions.append(depth)
+                depth, in_template = 0, False
+            continue
+        match = (_JS_SUBSTITUTION_PATTERN if substitutions else LEXER_PATTERNS[language]).search(source, pos)
+        if match is None:
+            return
+        kind, start = match.lastgroup, match.start()
+        if kind == "brace":
+            pos = match.end()
+            if match.group() == "{":
+                depth += 1
+            elif depth == 0:
+                # The '}' closing a substitution; the template literal continues
+                depth, in_template = substitutions.pop(), True
+            else:
+                depth -= 1
+        elif kind in ("line_comment", "block_comment"):
+            comments.append((start, match.end()))
+            pos = match.end()
+        elif kind == "nested_comment":
+            depth_of_comment, pos = 1, match.end()
+            while depth_of_comment:
+                part = _RUST_BLOCK_COMMENT_PART.search(source, pos)
+                if part is None:
+                    pos = len(source)
+                    break
+                depth_of_comment += 1 if part.group() == "/*" else -1
+                pos = part.end()
+            comments.append((start, pos))
+        elif kind == "rust_raw_string":
+            closing = '"' + match.group("hashes")
+            end = source.find(closing, match.end())
+            pos = len(source) if end == -1 else end + len(closing)
+        elif kind == "template":
+            pos, in_template = match.end(), True
+        elif kind == "slash":
+            literal_end = _js_regex_end(source, start, regex_failures) if _js_slash_starts_regex(source, start) else None
+            pos = literal_end or match.end()
+        else:
+            # Strings, characters and raw strings are kept as they are
+            pos = match.end()
+
+def _remove_comment_spans(source, comments):
+    """
+    Remove the comment spans from source. Comments on lines of their own are removed with their line,
+    trailing comments with the whitespace before them, and inline comments are replaced by a space when
+    they separate two tokens.
+    """
+    output = []
+    last_char = "\n"
+    pos = 0
+    for start, end in comments:
+        code = source[pos:start]
+        pos = end
+        if end >= len(source) or source[end] in "\r\n":
+            code = code.rstrip(" \t")
+            if (code[-1:] or last_char) == "\n":
+                pos = end + (2 if source.startswith("\r\n", end) else 1)
+        elif (code[-1:] or last_char) not in " \t\n" and source[end] not in " \t":
+            code += " "
+        if code:
+            output.append(code)
+            last_char = code[-1]
+    output.append(source[pos:])
+    return "".join(output)
+
+def strip_c_like_comments(source, language):
+    """Remove comments from JavaScript/TypeScript, Go, Java, Rust or CSS source code with a single-pass lexer."""
+    comments = []
+    _scan_comments(source, language, 0, comments)
+    return _remove_comment_spans(source, comments)
+
+def strip_go_comments(source):
+    """
+    Remove comments from Go source code, keeping the ones that are not documentation: compiler directives
+    (//go:build, //go:embed, // +build, //line, //export, //extern) and the cgo preamble before import "C".
+    """
+    comments = []
+    _scan_comments(source, "go", 0, comments)
+    removed = []
+    preamble_starts = set()
+    for start, end in reversed(comments):
+        following = _WHITESPACE.match(source, end).end()
+        if source.count("\n", end, following) <= 1 and (following in preamble_starts or _GO_IMPORT_C.match(source, following)):
+            preamble_starts.add(start)
+        elif not _GO_DIRECTIVE.match(source, start):
+            removed.append((start, end))
+    return _remove_comment_spans(source, removed[::-1])
+
+def strip_svelte_comments(source):
+    """
+    Remove comments from a Svelte component: JavaScript in <script>, CSS in <style> and HTML comments in the markup.
+    A <script> or <style> section without a closing tag runs to the end of the file.
+    """
+    output = []
+    comments = []  # HTML comment spans in the output
+    length = 0
+    pos = 0
+    tags_closed = True  # False once a '<script' or '<style' has no '>' after it, so neither can any later one
+    while True:
+        section = _SVELTE_SECTION_START.search(source, pos)
+        if section is None:
+            break
+        start = section.start()
+        if section.group() == "<!--":
+            end = source.find("-->", section.end())
+            end = len(source) if end == -1 else end + 3
+            text = source[pos:end]
+            comments.append((length + start - pos, length + len(text)))
+        else:
+            tag_end = source.find(">", section.end()) if tags_closed else -1
+            if tag_end == -1:
+                tags_closed = False
+                end = section.end()
+                text = source[pos:end]
+            else:
+                kind = section.group(1).lower()
+                closing = _SVELTE_SECTION_END[kind].search(source, tag_end + 1)
+                body_end, end = (closing.start(), closing.end()) if closing else (len(source), len(source))
+                body = strip_c_like_comments(source[tag_end + 1:body_end], "javascript" if kind == "script" else "css")
+                text = source[pos:tag_end + 1] + body + source[body_end:end]
+        output.append(text)
+        length += len(text)
+        pos = end
+    output.append(source[pos:])
+    return _remove_comment_spans("".join(output), comments)
+
+COMMENT_STRIPPERS = {}
+
+def register_comment_stripper(extensions, stripper):
+    """Register stripper(file_path, source) as the comment stripper for files with the given extensions."""
+    for extension in extensions:
+        COMMENT_STRIPPERS[extension] = stripper
+
+register_comment_stripper([".py", ".pyw"], strip_python_source)
+register_comment_stripper([".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx", ".mts", ".cts"], lambda file_path, source: strip_c_like_comments(source, "javascript"))
+register_comment_stripper([".go"], lambda file_path, source: strip_go_comments(source))
+register_comment_stripper([".java"], lambda file_path, source: strip_c_like_comments(source, "java"))
+register_comment_stripper([".rs"], lambda file_path, source: strip_c_like_comments(source, "rust"))
+register_comment_stripper([".css"], lambda file_path, source: strip_c_like_comments(source, "css"))
+register_comment_stripper([".svelte"], lambda file_path, source: strip_svelte_comments(source))
+
+def strip_comments(file_path, source):
+    """
+    Remove comments (and Python docstrings) from source with the stripper registered for the file's extension.
+    If the stripper fails, the file is kept with its comments (source itself is returned) rather than failing the run.
+    """
+    stripper = COMMENT_STRIPPERS.get(os.path.splitext(file_path)[1].lower())
+    if stripper is None:
+        return source
+    try:
+        return stripper(file_path, source)
+    except Exception as e:
+        print(f"Warning: Keeping comments in {file_path} because they could not be stripped ({type(e).__name__}: {e}).")
+        return source
+
 def remove_comments_and_docstrings(source):
     """Remove comments and docstrings from the Python source code."""
     tree = ast.parse(source)
     for node in ast.walk(tree):
         if isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.AsyncFunctionDef)) and ast.get_docstring(node):
-            node.body = node.body[1:]  # Remove docstring
+            node.body = node.body[1:] or [ast.Pass()]  # Remove docstring
         elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant):
             node.value.value = ""  # Remove comments
     return ast.unparse(tree)
 
+def token_headers(repo_url, token):
+    """
+    Return the headers authenticating token for repo_url. The token is only sent when the URL's host is
+    github.com or gitlab.com itself, never to another host whose URL merely mentions them.
+    """
+    host = (urllib.parse.urlsplit(repo_url).hostname or "").lower()
+    if host in GITLAB_HOSTS:
+        return {"PRIVATE-TOKEN": token}
+    if host in GITHUB_HOSTS:
+        return {"Authorization": f"token {token}"}
+    print(f"Warning: Not sending the token to {host or repo_url}, which is not github.com or gitlab.com.")
+    return {}
+
 def construct_download_url(repo_url, branch_or_tag):
     """Construct the appropriate download URL for GitHub or GitLab based on the provided URL."""
     if "github.com" in repo_url:
@@ -87,79 +665,1776 @@ def construct_download_url(repo_url, branch_or_tag):
     else:
         raise ValueError("Unsupported repository URL. Only GitHub and GitLab URLs are supported.")
 
-def download_repo(repo_url, output_file, lang, keep_comments=False, branch_or_tag="main", token=None, claude=False):
-    """Download and process files from a GitHub or GitLab repository."""
-    download_url = construct_download_url(repo_url, branch_or_tag)
-    headers = {}
+def iter_download(response, progress=None):
+    """Yield the chunks of a streamed response, reporting ("download", bytes_received, total_bytes or None) to progress."""
+    total = int(response.headers["Content-Length"]) if response.headers.get("Content-Length", "").isdigit() else None
+    received = 0
+    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+        received += len(chunk)
+        if progress:
+            progress("download", received, total)
+        yield chunk
 
-    if token:
-        if "gitlab.com" in repo_url:
-            headers['PRIVATE-TOKEN'] = token
-        elif "github.com" in repo_url:
-            headers['Authorization'] = f'token {token}'
+def spool_response(response, max_memory=DEFAULT_MAX_MEMORY, progress=None):
+    """Write a streamed response body to a file object without holding more than max_memory bytes in RAM."""
+    return spool_chunks(iter_download(response, progress), max_memory)
 
-    print(download_url)
-    response = requests.get(download_url, headers=headers)
+def spool_chunks(chunks, max_memory=DEFAULT_MAX_MEMORY):
+    """
+    Write chunks of bytes to a file object without holding more than max_memory bytes in RAM.
+    The data is buffered in memory until it grows past max_memory, then moved to a temporary file on disk.
+    """
+    spool = io.BytesIO()
+    for chunk in chunks:
+        if isinstance(spool, io.BytesIO) and spool.tell() + len(chunk) > max_memory:
+            disk_file = tempfile.TemporaryFile()
+            disk_file.write(spool.getbuffer())
+            spool = disk_file
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
 
+def fetch_archive(download_url, headers=None, max_memory=DEFAULT_MAX_MEMORY, session=None, progress=None, timeout=DEFAULT_TIMEOUT):
+    """Stream the ZIP archive at download_url to a spooled file and open it."""
+    with (session or requests).get(download_url, headers=headers, stream=True, timeout=timeout) as response:
+        if not response.ok:
+            raise zipfile.BadZipFile(f"{download_url} returned HTTP {response.status_code} {response.reason}.")
+        archive_file = spool_response(response, max_memory, progress)
     try:
-        zip_file = zipfile.ZipFile(io.BytesIO(response.content))
+        return zipfile.ZipFile(archive_file)
     except zipfile.BadZipFile:
-        print(f"Error: The downloaded file is not a valid ZIP archive.")
-        sys.exit(1)
+        archive_file.close()
+        raise
 
-    repo_name = repo_url.split('/')[-1]
-    output_file = os.path.join(output_folder, f"{repo_name}_{lang}.txt")
-    if claude:
-        output_file = os.path.join(output_folder, f"{repo_name}_{lang}-claude.txt")
+class ArchiveCache:
+    """
+    On-disk cache of downloaded archives, keyed by host, repository and ref.
+    Cached archives are revalidated with If-None-Match / If-Modified-Since, so an unchanged ref costs a
+    single request and no archive bytes. The least recently used archives are evicted once the cache
+    grows past max_size bytes.
+    """
 
-    with open(output_file, "w", encoding="utf-8") as outfile:
-        # Include the README file
-        readme_file_path, readme_content = find_readme_content(zip_file)
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE):
+        self.cache_dir = os.path.join(cache_dir, "archives")
+        self.stats_path = os.path.join(cache_dir, "stats.json")
+        self.max_size = max_size
+        self._stats_lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
 
-        if claude and isinstance(claude, bool):
-            outfile.write("Here are some documents for you to reference for your task:\n\n")
-            outfile.write("<documents>\n")
+    @staticmethod
+    def cache_key(download_url):
+        """Return the cache key for a download URL, ignoring any credentials embedded in it."""
+        parts = urllib.parse.urlsplit(download_url)
+        return f"{(parts.hostname or '').lower()}{parts.path}"
 
-            outfile.write("<document index=\"0\">\n")
-            outfile.write(f"<source>{readme_file_path}</source>\n")
-            outfile.write(f"<document_content>\n{readme_content}\n</document_content>\n")
-            outfile.write("</document>\n\n")
-        else:
-            outfile.write(f"{'// ' if lang == 'go' else '# '}File: {readme_file_path}\n")
-            outfile.write(readme_content)
-            outfile.write("\n\n")
+    def _paths(self, download_url):
+        digest = hashlib.sha256(self.cache_key(download_url).encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, digest)
+        return base + ".zip", base + ".json"
 
-        index = 1
-        for file_path in zip_file.namelist():
-            # Skip directories, non-language files, less likely useful files, hidden directories, and test files
-            if file_path.endswith("/") or not is_file_type(file_path, lang) or not is_likely_useful_file(file_path, lang):
+    def fetch(self, download_url, headers=None, offline=False, session=None, progress=None, timeout=DEFAULT_TIMEOUT):
+        """
+        Return the path of the cached archive for download_url, downloading or revalidating it as needed.
+        In offline mode the archive is served strictly from the cache and FileNotFoundError is raised on a miss.
+        """
+        archive_path, meta_path = self._paths(download_url)
+        meta = None
+        if os.path.exists(archive_path) and os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as meta_file:
+                meta = json.load(meta_file)
+
+        if offline:
+            if meta is None:
+                raise FileNotFoundError(f"{self.cache_key(download_url)} is not in the archive cache.")
+            self._record(hits=1, bytes_saved=meta["size"])
+            os.utime(archive_path)
+            return archive_path
+
+        request_headers = dict(headers or {})
+        if meta is not None:
+            if meta.get("etag"):
+                request_headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                request_headers["If-Modified-Since"] = meta["last_modified"]
+
+        with (session or requests).get(download_url, headers=request_headers, stream=True, timeout=timeout) as response:
+            if meta is not None and response.status_code == 304:
+                self._record(revalidated=1, bytes_saved=meta["size"])
+                os.utime(archive_path)
+                return archive_path
+
+            with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".part", delete=False) as part_file:
+                try:
+                    for chunk in iter_download(response, progress):
+                        part_file.write(chunk)
+                except BaseException:
+                    # Interrupted or cancelled; do not leave the partial download behind
+                    part_file.close()
+                    os.remove(part_file.name)
+                    raise
+            meta = {
+                "key": self.cache_key(download_url),
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "size": os.path.getsize(part_file.name),
+            }
+
+        # Never cache error pages or truncated downloads
+        if not response.ok or not zipfile.is_zipfile(part_file.name):
+            os.remove(part_file.name)
+            if not response.ok:
+                raise zipfile.BadZipFile(f"{download_url} returned HTTP {response.status_code} {response.reason}.")
+            raise zipfile.BadZipFile(f"{download_url} did not return a valid ZIP archive.")
+
+        os.replace(part_file.name, archive_path)
+        with open(meta_path, "w", encoding="utf-8") as meta_file:
+            json.dump(meta, meta_file)
+        self._record(misses=1, bytes_downloaded=meta["size"])
+        self.evict(keep=archive_path)
+        return archive_path
+
+    def evict(self, keep=None):
+        """Remove the least recently used archives until the cache fits in max_size bytes."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".zip"):
+                path = os.path.join(self.cache_dir, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if path == keep:
                 continue
+            os.remove(path)
+            if os.path.exists(path[:-len(".zip")] + ".json"):
+                os.remove(path[:-len(".zip")] + ".json")
+            total_size -= size
+            self._record(evictions=1)
 
-            try:
-                file_content = zip_file.read(file_path).decode("utf-8", errors="replace")
-            except UnicodeDecodeError:
-                print(f"Warning: Skipping file {file_path} due to decoding error.")
+    def _load_counters(self):
+        try:
+            with open(self.stats_path, encoding="utf-8") as stats_file:
+                return json.load(stats_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _record(self, **increments):
+        with self._stats_lock:
+            counters = self._load_counters()
+            for name, value in increments.items():
+                counters[name] = counters.get(name, 0) + value
+            counters["updated"] = time.time()
+            part_path = f"{self.stats_path}.{os.getpid()}.part"
+            with open(part_path, "w", encoding="utf-8") as stats_file:
+                json.dump(counters, stats_file)
+            os.replace(part_path, self.stats_path)
+
+    def stats(self):
+        """Return the cache contents summary and the hit/miss counters recorded across runs."""
+        sizes = [os.path.getsize(os.path.join(self.cache_dir, name)) for name in os.listdir(self.cache_dir) if name.endswith(".zip")]
+        counters = self._load_counters()
+        return {
+            "cache_dir": os.path.dirname(self.cache_dir),
+            "entries": len(sizes),
+            "total_size": sum(sizes),
+            "max_size": self.max_size,
+            "hits": counters.get("hits", 0),
+            "revalidated": counters.get("revalidated", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "bytes_downloaded": counters.get("bytes_downloaded", 0),
+            "bytes_saved": counters.get("bytes_saved", 0),
+        }
+
+class TransformCache:
+    """
+    Persistent, content-addressed cache of processed file output, keyed by the SHA-256 of the file
+    contents and the processing options. Identical files seen in other runs, branches or forks skip
+    the filters and comment stripping entirely. Entries are evicted least recently used first once the
+    stored output grows past max_size bytes.
+    Reads never lock the database. New entries and last-used times are written in short transactions of
+    TRANSFORM_CACHE_BATCH entries, so concurrent runs sharing the cache (--manifest, --serve, the GUI) do
+    not wait on each other for longer than one batch takes to write.
+    The cache can be pickled into worker processes; each process and thread opens its own database connection.
+    """
+
+    _connections = {}
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_TRANSFORM_CACHE_SIZE):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, "transforms.sqlite")
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._pending = []  # (key, content, size, last_used) not written yet
+        self._used = []  # (last_used, key) of hits not written yet
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["hits"] = state["misses"] = 0
+        state["_pending"], state["_used"] = [], []
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        key = (os.getpid(), threading.get_ident(), self.db_path)
+        if key not in self._connections:
+            # Autocommit, so that no transaction stays open between the batches written by _write
+            connection = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS transforms (key TEXT PRIMARY KEY, content TEXT, size INTEGER, last_used REAL)")
+            self._connections[key] = connection
+        return self._connections[key]
+
+    @staticmethod
+    def key(data, lang, keep_comments):
+        digest = hashlib.sha256(data)
+        digest.update(f"\0{lang}\0{keep_comments}\0{TRANSFORM_VERSION}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return (found, content); content is None for files that were skipped."""
+        connection = self._connect()
+        row = connection.execute("SELECT content FROM transforms WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        with self._lock:
+            self._used.append((time.time(), key))
+            full = len(self._used) >= TRANSFORM_CACHE_BATCH
+        if full:
+            self.flush()
+        return True, row[0]
+
+    def put(self, key, content):
+        size = len(key) + (len(content.encode("utf-8")) if content is not None else 0)
+        with self._lock:
+            self._pending.append((key, content, size, time.time()))
+            full = len(self._pending) >= TRANSFORM_CACHE_BATCH
+        if full:
+            self.flush()
+
+    def _write(self, statements):
+        """Run (sql, rows) statements in one transaction, rolled back if any of them fails."""
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, rows in statements:
+                connection.executemany(sql, rows)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def flush(self):
+        """Write the pending entries and last-used times."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            used, self._used = self._used, []
+        if pending or used:
+            self._write([("INSERT OR REPLACE INTO transforms VALUES (?, ?, ?, ?)", pending),
+                         ("UPDATE transforms SET last_used = ? WHERE key = ?", used)])
+
+    def close(self):
+        """Write pending entries and evict the least recently used ones above max_size."""
+        self.flush()
+        connection = self._connect()
+        total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM transforms").fetchone()[0]
+        if total_size > self.max_size:
+            evicted, keys = 0, []
+            for key, size in connection.execute("SELECT key, size FROM transforms ORDER BY last_used").fetchall():
+                if total_size - evicted <= self.max_size:
+                    break
+                keys.append((key,))
+                evicted += size
+            self._write([("DELETE FROM transforms WHERE key = ?", keys)])
+
+class HttpRangeFile(io.RawIOBase):
+    """
+    Read-only, seekable file over a remote archive that fetches bytes on demand with HTTP Range requests.
+    Fetched ranges are written at their offsets into a sparse temporary file, so zipfile can read the
+    central directory and individual members without downloading the rest of the archive.
+    """
+
+    def __init__(self, url, size, headers=None, session=None, timeout=DEFAULT_TIMEOUT):
+        self.url = url
+        self.size = size
+        self.headers = dict(headers or {})
+        self.session = session or requests
+        self.timeout = timeout
+        self.requests_made = 0
+        self.bytes_fetched = 0
+        self._file = tempfile.TemporaryFile()
+        self._starts, self._ends = [], []  # Sorted, non-overlapping ranges already fetched
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self._pos = max(0, offset)
+        return self._pos
+
+    def _missing(self, start, end):
+        """Return the sub-ranges of [start, end) that have not been fetched yet."""
+        missing = []
+        i = max(bisect.bisect_right(self._starts, start) - 1, 0)
+        while start < end and i < len(self._starts):
+            if self._ends[i] <= start:
+                i += 1
                 continue
+            if self._starts[i] >= end:
+                break
+            if self._starts[i] > start:
+                missing.append((start, self._starts[i]))
+            start = max(start, self._ends[i])
+            i += 1
+        if start < end:
+            missing.append((start, end))
+        return missing
+
+    def _mark_fetched(self, start, end):
+        i = bisect.bisect_left(self._starts, start)
+        self._starts.insert(i, start)
+        self._ends.insert(i, end)
+        # Merge with overlapping or adjacent neighbours
+        merged_starts, merged_ends = [], []
+        for range_start, range_end in zip(self._starts, self._ends):
+            if merged_ends and range_start <= merged_ends[-1]:
+                merged_ends[-1] = max(merged_ends[-1], range_end)
+            else:
+                merged_starts.append(range_start)
+                merged_ends.append(range_end)
+        self._starts, self._ends = merged_starts, merged_ends
+
+    def store(self, start, response):
+        """Write the body of a 206 response for the range starting at start into the local file."""
+        self._file.seek(start)
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            self._file.write(chunk)
+        end = self._file.tell()
+        self.bytes_fetched += end - start
+        self._mark_fetched(start, end)
+
+    def fetch(self, start, end):
+        """Fetch [start, end) from the server unless it is already available locally."""
+        for missing_start, missing_end in self._missing(start, min(end, self.size)):
+            headers = dict(self.headers, Range=f"bytes={missing_start}-{missing_end - 1}")
+            with self.session.get(self.url, headers=headers, stream=True, timeout=self.timeout) as response:
+                if response.status_code != 206:
+                    raise requests.HTTPError(f"Expected a partial response for {self.url}, got HTTP {response.status_code}.")
+                self.requests_made += 1
+                self.store(missing_start, response)
+
+    def prefetch(self, ranges):
+        """
+        Fetch many (start, end) ranges, coalescing neighbouring ones into single requests. Ranges are only merged
+        while the gap bytes fetched for nothing stay a small fraction of the requested bytes, so that matching
+        files interleaved with skipped ones do not turn into a download of the whole archive.
+        """
+        coalesced = []  # [start, end, requested bytes, gap bytes]
+        for start, end in sorted(ranges):
+            if coalesced:
+                last = coalesced[-1]
+                gap = max(start - last[1], 0)
+                if gap <= SPARSE_COALESCE_GAP and last[3] + gap <= SPARSE_MAX_WASTE * (last[2] + end - start):
+                    last[1] = max(last[1], end)
+                    last[2] += end - start
+                    last[3] += gap
+                    continue
+            coalesced.append([start, end, end - start, 0])
+        for start, end, _, _ in coalesced:
+            self.fetch(start, end)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self._pos
+        end = min(self._pos + size, self.size)
+        if self._pos >= end:
+            return b""
+        if self._missing(self._pos, end):
+            self.fetch(self._pos, max(end, self._pos + SPARSE_MIN_FETCH))
+        self._file.seek(self._pos)
+        data = self._file.read(end - self._pos)
+        self._pos += len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+def open_sparse_archive(download_url, headers=None, session=None, max_memory=DEFAULT_MAX_MEMORY, progress=None, timeout=DEFAULT_TIMEOUT):
+    """
+    Open a remote ZIP archive reading only the end of central directory and central directory with Range requests.
+    Members are fetched on demand (see prefetch_members). If the server ignores Range, the full response that
+    was already received is spooled instead, exactly as fetch_archive does.
+    """
+    http = session or requests
+    range_headers = dict(headers or {}, Range=f"bytes=-{SPARSE_TAIL_SIZE}")
+    with http.get(download_url, headers=range_headers, stream=True, timeout=timeout) as response:
+        content_range = response.headers.get("Content-Range", "")
+        if not response.ok:
+            raise zipfile.BadZipFile(f"{download_url} returned HTTP {response.status_code} {response.reason}.")
+        if response.status_code != 206 or "/" not in content_range or content_range.endswith("/*"):
+            print("Warning: The server does not support range requests, downloading the full archive.")
+            return zipfile.ZipFile(spool_response(response, max_memory, progress))
+        first_byte = int(content_range.split()[-1].split("-")[0])
+        remote_file = HttpRangeFile(response.url, int(content_range.rsplit("/", 1)[1]), headers, session, timeout)
+        remote_file.requests_made += 1
+        remote_file.store(first_byte, response)
+    return zipfile.ZipFile(remote_file)
+
+def prefetch_members(zip_file, infos):
+    """Fetch the byte ranges of the given members of a sparse archive, coalescing adjacent ranges."""
+    # The local header usually repeats the central directory's name and extra field; any shortfall is fetched on read
+    zip_file.fp.prefetch((info.header_offset, info.header_offset + LOCAL_FILE_HEADER.size + len(info.orig_filename.encode("utf-8"))
+                          + len(info.extra) + info.compress_size) for info in infos)
+
+class LocalFileInfo(zipfile.ZipInfo):
+    """ZipInfo for a file on disk; its CRC32 is only computed when something asks for it."""
+
+    _crc = None
+
+    def __init__(self, filename, path, size):
+        super().__init__(filename)
+        self.path = path
+        self.file_size = size
+        self.compress_size = size
+
+    @property
+    def CRC(self):
+        if self._crc is None:
+            with open(self.path, "rb") as local_file:
+                if self.file_size < LOCAL_MMAP_THRESHOLD:
+                    self._crc = zlib.crc32(local_file.read())
+                else:
+                    with mmap.mmap(local_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        self._crc = zlib.crc32(mapped)
+        return self._crc
+
+    @CRC.setter
+    def CRC(self, value):
+        self._crc = value
+
+class DirectorySource:
+    """
+    A local directory read through the subset of the zipfile.ZipFile API used by the processing pipeline.
+    Entries are named '<directory name>/<relative path>' like the top-level folder of a repository archive.
+    The tree walk skips hidden directories and honors .gitignore files; contents are only read on demand.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.fp = None
+        self._infos = []
+        self._by_name = {}
+        self._walk(self.path, os.path.basename(self.path) + "/", [])
+
+    def _walk(self, directory, prefix, ignore_rules):
+        ignore_file = os.path.join(directory, ".gitignore")
+        if os.path.isfile(ignore_file):
+            rules = [(re.compile(glob_to_regex(rule[1:] if rule.startswith("!") else rule)), rule.startswith("!"))
+                     for rule in reversed(read_rules_file(ignore_file))]
+            # The deepest .gitignore is consulted first, with paths relative to its own directory
+            ignore_rules = [(len(prefix), rules)] + ignore_rules
+        with os.scandir(directory) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+        for entry in entries:
+            name = prefix + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if not entry.name.startswith(".") and not self._ignored(name + "/", ignore_rules):
+                    self._walk(entry.path, name + "/", ignore_rules)
+            elif entry.is_file() and not self._ignored(name, ignore_rules):
+                info = LocalFileInfo(name, entry.path, entry.stat().st_size)
+                self._infos.append(info)
+                self._by_name[name] = info
+
+    @staticmethod
+    def _ignored(name, ignore_rules):
+        for start, rules in ignore_rules:
+            for rule, negated in rules:
+                if rule.fullmatch(name[start:]):
+                    return not negated
+        return False
+
+    def infolist(self):
+        return self._infos
+
+    def namelist(self):
+        return [info.filename for info in self._infos]
+
+    def read(self, name):
+        info = name if isinstance(name, zipfile.ZipInfo) else self._by_name[name]
+        with open(info.path, "rb") as local_file:
+            return local_file.read()
+
+    def close(self):
+        pass
+
+def run_git(repo_path, *args):
+    """Run a git command in repo_path and return its stripped output, or None if it fails."""
+    try:
+        result = subprocess.run(["git", "-C", repo_path, *args], capture_output=True, text=True)
+    except FileNotFoundError:
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+def open_git_archive(repo_path, ref, max_memory=DEFAULT_MAX_MEMORY):
+    """Read the tree of a (bare or non-bare) git repository at ref with 'git archive' into a spooled ZIP archive."""
+    name = get_repo_name(repo_path)
+    process = subprocess.Popen(["git", "-C", repo_path, "archive", "--format=zip", f"--prefix={name}-{ref.replace('/', '-')}/", ref],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    archive_file = spool_chunks(iter(lambda: process.stdout.read(DOWNLOAD_CHUNK_SIZE), b""), max_memory)
+    error = process.stderr.read().decode("utf-8", errors="replace").strip()
+    if process.wait() != 0:
+        archive_file.close()
+        raise FileNotFoundError(f"git archive of {ref} in {repo_path} failed: {error}")
+    return zipfile.ZipFile(archive_file)
+
+def open_local_source(path, ref=None, max_memory=DEFAULT_MAX_MEMORY):
+    """
+    Open a local source with the same interface as a downloaded archive: a ZIP file, a git repository at ref
+    (read with 'git archive'; bare repositories default to HEAD), or a directory tree. A git checkout without
+    a ref is read from its working tree, including uncommitted changes.
+    """
+    if os.path.isfile(path):
+        return zipfile.ZipFile(path)
+    if ref is None and run_git(path, "rev-parse", "--is-bare-repository") == "true":
+        ref = "HEAD"
+    if ref is not None:
+        if run_git(path, "rev-parse", "--git-dir") is None:
+            raise FileNotFoundError(f"{path} is not a git repository, so {ref} cannot be read from it.")
+        return open_git_archive(path, ref, max_memory)
+    return DirectorySource(path)
+
+def get_repo_name(repo_url):
+    """Return the repository name used for output files, for a URL or a local directory, git repository or ZIP file."""
+    if os.path.exists(repo_url):
+        name = os.path.basename(os.path.abspath(repo_url))
+    else:
+        name = repo_url.rstrip("/").split("/")[-1]
+    for suffix in (".zip", ".git"):
+        if name.endswith(suffix) and len(name) > len(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+def get_output_name(repo_url, lang, claude=False, branch_or_tag=None):
+    """
+    Return the file name of the combined output, <repo>_<lang>.txt or <repo>_<lang>-claude.txt.
+    With branch_or_tag, the ref is added to the name (<repo>@<ref>_<lang>.txt) to keep the outputs of several refs apart.
+    """
+    name = get_repo_name(repo_url)
+    if branch_or_tag:
+        name += "@" + re.sub(r"[^\w.-]", "-", branch_or_tag)
+    return f"{name}_{lang}-claude.txt" if claude else f"{name}_{lang}.txt"
+
+def process_file(file_path, data, lang, keep_comments=False, transform_cache=None, stats=None):
+    """
+    Decode and filter a single file, returning its processed content or None if it should be skipped.
+    With a RunStats, the reason a file is skipped is counted, and so is the reason a file is kept but not as
+    intended (undecodable bytes replaced, or comments kept).
+    """
+    if transform_cache is not None:
+        key = transform_cache.key(data, lang, keep_comments)
+        found, file_content = transform_cache.get(key)
+        if not found:
+            file_content = process_file(file_path, data, lang, keep_comments, stats=stats)
+            transform_cache.put(key, file_content)
+        elif stats and file_content is None:
+            stats.skip("cached_skip")
+        return file_content
+
+    try:
+        file_content = data.decode("utf-8")
+    except UnicodeDecodeError:
+        # Kept with the undecodable bytes replaced, like the README; counted so --stats shows files that are not UTF-8
+        if stats:
+            stats.warn("decode_error")
+        file_content = data.decode("utf-8", errors="replace")
+
+    # Skip test files based on content and files with insufficient substantive content
+    if not is_substantive_file(file_content, lang):
+        if stats:
+            pattern = _test_indicator_patterns.get(lang)
+            stats.skip("test_content" if pattern and pattern.search(file_content) else "insufficient_content")
+        return None
+    if not keep_comments:
+        stripped = strip_comments(file_path, file_content)
+        if stats and stripped is file_content and COMMENT_STRIPPERS.get(os.path.splitext(file_path)[1].lower()) is strip_python_source:
+            stats.warn("syntax_error")  # Kept with its comments, see strip_python_source
+        file_content = stripped
+    return file_content
 
-            # Skip test files based on content and files with insufficient substantive content
-            if is_test_file(file_content, lang) or not has_sufficient_content(file_content):
+def read_raw_member(zip_file, info):
+    """
+    Return the still-compressed bytes of a ZIP member and their compression method, so that inflating
+    can happen in a worker process. Members that cannot be inflated that way are read normally instead.
+    """
+    if isinstance(info, LocalFileInfo) or info.flag_bits & 0x1 or info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED, zipfile.ZIP_BZIP2):
+        return zip_file.read(info), zipfile.ZIP_STORED
+    zip_file.fp.seek(info.header_offset)
+    header = LOCAL_FILE_HEADER.unpack(zip_file.fp.read(LOCAL_FILE_HEADER.size))
+    zip_file.fp.seek(header[-2] + header[-1], os.SEEK_CUR)  # Skip the file name and extra field
+    return zip_file.fp.read(info.compress_size), info.compress_type
+
+def decompress_member(data, compress_type):
+    """Inflate member bytes returned by read_raw_member."""
+    if compress_type == zipfile.ZIP_DEFLATED:
+        return zlib.decompress(data, -15)
+    if compress_type == zipfile.ZIP_BZIP2:
+        return bz2.decompress(data)
+    return data
+
+def worker_context():
+    """
+    Multiprocessing context for the --jobs worker processes. download_repo runs on several threads at once with
+    --manifest, --serve and in the GUI, and a process forked from a multithreaded parent can deadlock on a lock
+    another thread held, so workers are started from a fork server, or spawned where there is none.
+    """
+    return multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+def process_members(batch, lang, keep_comments=False, transform_cache=None, collect_stats=False):
+    """
+    Worker entry point: inflate and process a batch of (file_path, data, compress_type) members.
+    Returns the (file_path, file_content) results, the transform cache hits and misses of the batch,
+    and with collect_stats a RunStats of the batch (otherwise None).
+    """
+    if collect_stats:
+        stats = RunStats()
+        results = []
+        for file_path, data, compress_type in batch:
+            wall, cpu = time.perf_counter(), time.process_time()
+            data = decompress_member(data, compress_type)
+            results.append((file_path, process_file(file_path, data, lang, keep_comments, transform_cache, stats)))
+            stats.record_file(file_path, time.perf_counter() - wall, time.process_time() - cpu, len(data))
+    else:
+        stats = None
+        results = [(file_path, process_file(file_path, decompress_member(data, compress_type), lang, keep_comments, transform_cache))
+                   for file_path, data, compress_type in batch]
+    if transform_cache is None:
+        return results, 0, 0, stats
+    transform_cache.flush()
+    return results, transform_cache.hits, transform_cache.misses, stats
+
+def iter_candidate_files(zip_file, path_filter, metadata_filter=None, order=None):
+    """
+    Yield the ZipInfo of every archive entry that passes the path and metadata filters, in archive order,
+    or sorted by the order key. Only the ZipInfo metadata already in memory is sorted, never file contents.
+    """
+    # Skip directories, non-language files, less likely useful files, hidden directories, and test files
+    candidates = (info for info in zip_file.infolist() if path_filter(info.filename))
+    if metadata_filter is not None:
+        candidates = (info for info in candidates if metadata_filter(info))
+    if order is not None:
+        candidates = iter(sorted(candidates, key=order))
+    return candidates
+
+def file_priority(info):
+    """Sort key for packing files into a budget: shallower paths first, entrypoints first at each depth, then smaller files."""
+    name = os.path.splitext(os.path.basename(info.filename))[0].lower()
+    return (info.filename.count("/"), name not in ENTRYPOINT_NAMES, info.file_size, info.filename)
+
+def iter_processed_files(zip_file, lang, keep_comments=False, jobs=1, transform_cache=None, path_filter=None, metadata_filter=None, reuse=None, on_result=None, order=None, stats=None):
+    """
+    Yield (file_path, file_content) for every file kept from the archive, in archive order or sorted by the order key.
+    path_filter defaults to a PathFilter with the default rules for lang.
+    With jobs > 1, inflating and processing run in a pool of worker processes while the main
+    process keeps reading members from the archive; results are still yielded in archive order.
+    reuse(info) may return (True, file_content) to take a file's result from a previous run instead of
+    processing it, and on_result(info, file_content) is called for every candidate, including skipped ones.
+    With a RunStats, the time spent on each file and the reasons files are skipped are recorded in it.
+    """
+    path_filter = path_filter or PathFilter(lang)
+    if jobs <= 1:
+        for info in iter_candidate_files(zip_file, path_filter, metadata_filter, order):
+            found, file_content = reuse(info) if reuse else (False, None)
+            if not found and stats:
+                wall, cpu = time.perf_counter(), time.process_time()
+                data = zip_file.read(info)
+                file_content = process_file(info.filename, data, lang, keep_comments, transform_cache, stats)
+                stats.record_file(info.filename, time.perf_counter() - wall, time.process_time() - cpu, len(data))
+            elif not found:
+                file_content = process_file(info.filename, zip_file.read(info), lang, keep_comments, transform_cache)
+            if on_result:
+                on_result(info, file_content)
+            if file_content is not None:
+                yield info.filename, file_content
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=worker_context()) as executor:
+        pending = collections.deque()  # (future, infos) per batch, in archive order
+        batch, batch_infos, batch_bytes = [], [], 0
+
+        def submit():
+            pending.append((executor.submit(process_members, batch, lang, keep_comments, transform_cache, stats is not None), batch_infos))
+
+        def completed():
+            future, infos = pending.popleft()
+            results, hits, misses, batch_stats = future.result()
+            if batch_stats is not None:
+                stats.merge(batch_stats)
+            if transform_cache is not None:
+                transform_cache.hits += hits
+                transform_cache.misses += misses
+            for info, (path, content) in zip(infos, results):
+                if on_result:
+                    on_result(info, content)
+                if content is not None:
+                    yield path, content
+
+        for info in iter_candidate_files(zip_file, path_filter, metadata_filter, order):
+            found, file_content = reuse(info) if reuse else (False, None)
+            if found:
+                # Queue the reused result behind the batches before it to keep the archive order
+                if batch:
+                    submit()
+                    batch, batch_infos, batch_bytes = [], [], 0
+                reused = concurrent.futures.Future()
+                reused.set_result(([(info.filename, file_content)], 0, 0, None))
+                pending.append((reused, [info]))
+            else:
+                data, compress_type = read_raw_member(zip_file, info)
+                batch.append((info.filename, data, compress_type))
+                batch_infos.append(info)
+                batch_bytes += len(data)
+                if batch_bytes >= WORKER_BATCH_BYTES or len(batch) >= WORKER_BATCH_FILES:
+                    submit()
+                    batch, batch_infos, batch_bytes = [], [], 0
+            # Bound the number of batches in flight so memory does not grow with the archive size
+            while len(pending) > jobs * 2:
+                yield from completed()
+        if batch:
+            submit()
+        while pending:
+            yield from completed()
+
+class OutputWriter:
+    """
+    Writes the combined output file, as plain text with '# File:' headers or in the --claude <documents>
+    format, and records the byte offset, length and SHA-256 of every file's content in the output.
+    """
+
+    def __init__(self, outfile, lang, claude=False):
+        self.outfile = outfile  # Opened in binary mode
+        self.lang = lang
+        self.claude = claude and isinstance(claude, bool)
+        self.position = 0
+        self.index = 0
+
+    def write(self, text):
+        data = text.encode("utf-8")
+        self.outfile.write(data)
+        self.position += len(data)
+        return data
+
+    def write_start(self):
+        if self.claude:
+            self.write("Here are some documents for you to reference for your task:\n\n")
+            self.write("<documents>\n")
+
+    def framing(self, file_path):
+        """Return the header and footer written around the next file's content."""
+        if self.claude:
+            return f"<document index=\"{self.index}\">\n<source>{file_path}</source>\n<document_content>\n", "\n</document_content>\n</document>\n\n"
+        return f"{'// ' if self.lang == 'go' else '# '}File: {file_path}\n", "\n\n"
+
+    def write_file(self, file_path, file_content):
+        """Write one file (the README first) and return the (offset, length, sha256) of its content."""
+        header, footer = self.framing(file_path)
+        self.write(header)
+        offset = self.position
+        data = file_content if isinstance(file_content, bytes) else file_content.encode("utf-8")
+        self.outfile.write(data)
+        self.position += len(data)
+        self.write(footer)
+        self.index += 1
+        return offset, len(data), hashlib.sha256(data).hexdigest()
+
+    def end_marker(self):
+        return "</documents>" if self.claude else ""
+
+    def write_end(self):
+        self.write(self.end_marker())
+
+def open_part_file(path, mode="wb"):
+    """
+    Open a uniquely named temporary file next to path, to be moved into place with os.replace once it is complete,
+    so that concurrent runs writing the same output never write into each other's file.
+    """
+    part_file = tempfile.NamedTemporaryFile(mode, encoding=None if "b" in mode else "utf-8", dir=os.path.dirname(path) or ".",
+                                            prefix=os.path.basename(path) + ".", suffix=".part", delete=False)
+    os.chmod(part_file.name, 0o666 & ~UMASK)
+    return part_file
+
+def estimate_tokens(size):
+    """Estimate the number of LLM tokens in size bytes of UTF-8 text, without a tokenizer."""
+    return (size + BYTES_PER_TOKEN - 1) // BYTES_PER_TOKEN
+
+class PackedOutput:
+    """
+    Writes the combined output within a token and byte budget per output file (0 for no limit).
+    A file that does not fit in the remaining budget is dropped, or with shard=True starts the next
+    numbered output file (<name>-1.txt, <name>-2.txt, ...); document indices continue across shards.
+    A file too large for the budget of a whole output file is dropped even with shard=True, with a warning.
+    Files are written as they arrive, so memory does not grow with the size of the repository.
+    With index=True, every output file gets a sidecar <output>.index.jsonl with the path, byte offset, length
+    and SHA-256 of each file's content; compress=True writes a block-compressed <output>.gz instead of plain
+    text (see BlockGzipFile) and always indexes it. Output goes to .part files (see open_part_file) that close() moves into place.
+    With a binary stream, everything is written to it instead of any file; sharding, index and compress do not apply.
+    """
+
+    def __init__(self, output_file, lang, claude=False, max_tokens=0, max_bytes=0, shard=False, index=False, compress=False, stream=None):
+        self.output_file = output_file
+        self.stream = stream
+        self.lang = lang
+        self.claude = claude
+        self.max_tokens = max_tokens
+        self.max_bytes = max_bytes
+        self.shard = shard
+        self.index = index or compress
+        self.compress = compress
+        self.index_file = None
+        self.paths = []
+        self.parts = {}  # Output path -> the .part file written in its place
+        self.dropped_files = 0
+        self.dropped_bytes = 0
+        self.writer = None
+        self._open_shard()
+
+    def _open_shard(self):
+        index = 0
+        if self.writer is not None:
+            self._finish_shard()
+            index = self.writer.index
+        if self.stream is not None:
+            self.writer = OutputWriter(self.stream, self.lang, self.claude)
+            self.writer.write_start()
+            self.files_in_shard = 0
+            return
+        if self.shard:
+            base, ext = os.path.splitext(self.output_file)
+            path = f"{base}-{len(self.paths) + 1}{ext}"
+        else:
+            path = self.output_file
+        if self.compress:
+            path += ".gz"
+        self.paths.append(path)
+        outfile = self._open_part(path, "wb")
+        self.writer = OutputWriter(BlockGzipFile(outfile) if self.compress else outfile, self.lang, self.claude)
+        self.writer.index = index
+        if self.index:
+            self.index_file = self._open_part(path + ".index.jsonl", "w")
+        self.writer.write_start()
+        self.files_in_shard = 0
+
+    def _open_part(self, path, mode):
+        part_file = open_part_file(path, mode)
+        self.parts[path] = part_file.name
+        return part_file
+
+    def _finish_shard(self):
+        self.writer.write_end()
+        if self.stream is None:
+            self.writer.outfile.close()
+        if self.index_file is not None:
+            self.index_file.close()
+
+    def _fits(self, size):
+        total = self.writer.position + size + len(self.writer.end_marker())
+        if self.max_bytes and total > self.max_bytes:
+            return False
+        return not self.max_tokens or estimate_tokens(total) <= self.max_tokens
+
+    def add(self, file_path, file_content):
+        """Write a file if it fits the budget and return its (offset, length, sha256), or None if it was dropped."""
+        data = file_content.encode("utf-8")
+        header, footer = self.writer.framing(file_path)
+        size = len(header.encode("utf-8")) + len(data) + len(footer)
+        if not self._fits(size) and self.shard and self.files_in_shard:
+            self._open_shard()
+            header, footer = self.writer.framing(file_path)
+            size = len(header.encode("utf-8")) + len(data) + len(footer)
+        if not self._fits(size):
+            self.dropped_files += 1
+            self.dropped_bytes += len(data)
+            if self.shard:
+                print(f"Warning: Dropping {file_path} ({len(data)} bytes), which does not fit the budget of a shard on its own.")
+            return None
+        self.files_in_shard += 1
+        block = self.writer.outfile.checkpoint() if self.compress else None
+        location = self.writer.write_file(file_path, data)
+        if self.index_file is not None:
+            entry = {"path": file_path, "offset": location[0], "length": location[1], "sha256": location[2]}
+            if block:
+                entry["block_offset"], entry["block_start"] = block
+            self.index_file.write(json.dumps(entry) + "\n")
+        return location
+
+    def discard(self):
+        """Remove the partially written output files, leaving any previous output in place."""
+        if self.stream is None:
+            self.writer.outfile.close()
+        if self.index_file is not None:
+            self.index_file.close()
+        for part_path in self.parts.values():
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    def close(self):
+        """Finish the output and return the paths of the output files."""
+        self._finish_shard()
+        for path, part_path in self.parts.items():
+            os.replace(part_path, path)
+        return self.paths
+
+class BlockGzipFile:
+    """
+    Write-only gzip file made of independently compressed members. A new member is only started at a
+    checkpoint (before a file is written) once the current one holds block_size uncompressed bytes, so a
+    reader can seek to the member holding a file and decompress from there. Concatenated gzip members
+    are still a valid gzip file for gzip, zcat and the gzip module.
+    """
+
+    def __init__(self, raw, block_size=INDEX_BLOCK_SIZE, level=6):
+        self.raw = raw
+        self.block_size = block_size
+        self.level = level
+        self.position = 0  # Uncompressed bytes written
+        self.member_offset = 0  # Compressed offset of the current member
+        self.member_start = 0  # Uncompressed offset of the current member
+        self._compressor = None
+
+    def write(self, data):
+        if self._compressor is None:
+            self._compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        self.raw.write(self._compressor.compress(data))
+        self.position += len(data)
+
+    def checkpoint(self):
+        """Start a new member if the current one is full; return the (compressed offset, uncompressed offset) of the member written next."""
+        if self._compressor is not None and self.position - self.member_start >= self.block_size:
+            self._end_member()
+        return self.member_offset, self.member_start
+
+    def _end_member(self):
+        self.raw.write(self._compressor.flush())
+        self._compressor = None
+        self.member_offset = self.raw.tell()
+        self.member_start = self.position
+
+    def close(self):
+        if self._compressor is not None:
+            self._end_member()
+        self.raw.close()
+
+class IndexedOutput:
+    """
+    Random access to an output file written with an index (--index or --compress). Single files or globs are
+    read through the sidecar <output>.index.jsonl without scanning the output; for a block-compressed .gz
+    output only the gzip members holding the requested files are decompressed.
+    """
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        with open(output_path + ".index.jsonl", encoding="utf-8") as index_file:
+            self.entries = [json.loads(line) for line in index_file if line.strip()]
+        self._by_path = {entry["path"]: entry for entry in self.entries}
+
+    def paths(self):
+        return [entry["path"] for entry in self.entries]
+
+    def read(self, file_path):
+        """Return the content of one file; KeyError if it is not in the output."""
+        with open(self.output_path, "rb") as output_file:
+            return self._read_entry(output_file, self._by_path[file_path])
+
+    def iter_matching(self, patterns):
+        """
+        Yield (file_path, content) for every file matching one of the .gitignore-style patterns, relative to
+        the repository root, in output order.
+        """
+        pattern = re.compile("|".join(f"(?:{glob_to_regex(pattern)})" for pattern in patterns))
+        with open(self.output_path, "rb") as output_file:
+            for entry in self.entries:
+                relative_path = entry["path"].split("/", 1)[-1]
+                if pattern.fullmatch(relative_path) or pattern.fullmatch(entry["path"]):
+                    yield entry["path"], self._read_entry(output_file, entry)
+
+    def _read_entry(self, output_file, entry):
+        if "block_offset" not in entry:
+            output_file.seek(entry["offset"])
+            data = output_file.read(entry["length"])
+        else:
+            output_file.seek(entry["block_offset"])
+            skip = entry["offset"] - entry["block_start"]
+            chunks, received, pending = [], 0, b""
+            decompressor = zlib.decompressobj(31)
+            while received < skip + entry["length"]:
+                if decompressor.eof:
+                    pending = decompressor.unused_data
+                    decompressor = zlib.decompressobj(31)
+                if not pending:
+                    pending = output_file.read(INDEX_READ_CHUNK)
+                    if not pending:
+                        break
+                chunk = decompressor.decompress(pending)
+                pending = b""
+                chunks.append(chunk)
+                received += len(chunk)
+            data = b"".join(chunks)[skip:skip + entry["length"]]
+        if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+            raise ValueError(f"The content of {entry['path']} in {self.output_path} does not match its index.")
+        return data.decode("utf-8")
+
+class OutputManifest:
+    """
+    Sidecar manifest written next to an output file for incremental refreshes. It records, for every candidate
+    file, its CRC32 and size from the archive, whether it was kept, and the byte offset, length and SHA-256 of
+    its processed content in the output. A later run with the same processing options takes the content of
+    files whose CRC32 and size are unchanged from the previous output instead of decompressing and processing
+    them again. Paths are stored relative to the archive root, so revisions of another ref still match.
+    """
+
+    def __init__(self, output_file, options, root_prefix=""):
+        self.path = output_file + ".manifest.json"
+        self.options = options
+        self.root_prefix = root_prefix
+        self.previous = {}
+        self.entries = {}
+        self.reused = 0
+        self._previous_output = None
+        try:
+            with open(self.path, encoding="utf-8") as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest.get("options") == options and os.path.exists(output_file):
+                self.previous = {entry["path"]: entry for entry in manifest["files"]}
+                self._previous_output = open(output_file, "rb")
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+
+    def relative_path(self, file_path):
+        return file_path[len(self.root_prefix):] if file_path.startswith(self.root_prefix) else file_path
+
+    def unchanged(self, info):
+        """Return the previous entry for a file whose CRC32 and size match the previous run, else None."""
+        entry = self.previous.get(self.relative_path(info.filename))
+        if entry is None or entry["crc"] != info.CRC or entry["size"] != info.file_size:
+            return None
+        return entry
+
+    def reuse(self, info):
+        """Return (True, file_content) for a file unchanged since the previous run (None if it was skipped), else (False, None)."""
+        entry = self.unchanged(info)
+        if entry is None:
+            return False, None
+        if entry["kept"]:
+            self._previous_output.seek(entry["offset"])
+            data = self._previous_output.read(entry["length"])
+            if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+                return False, None
+            file_content = data.decode("utf-8")
+        else:
+            file_content = None
+        self.reused += 1
+        return True, file_content
+
+    def record(self, info, file_content):
+        """Record the outcome for a candidate file; kept files get their location from record_location."""
+        self.entries[info.filename] = {"path": self.relative_path(info.filename), "crc": info.CRC, "size": info.file_size, "kept": file_content is not None}
+
+    def record_location(self, file_path, offset, length, sha256):
+        self.entries[file_path].update(offset=offset, length=length, sha256=sha256)
+
+    def save(self):
+        if self._previous_output is not None:
+            self._previous_output.close()
+        with open_part_file(self.path, "w") as manifest_file:
+            # Files dropped to fit a token budget have no recorded content and are processed again next time
+            files = [entry for entry in self.entries.values() if "offset" in entry or not entry["kept"]]
+            json.dump({"options": self.options, "files": files}, manifest_file)
+        os.replace(manifest_file.name, self.path)
+
+class RunStats:
+    """
+    Instrumentation for --stats and --report: wall and CPU time per stage, bytes downloaded, decompressed
+    and written, files per skip reason, files kept despite a problem (warnings) and the slowest files. Nothing is measured unless a RunStats is
+    passed to download_repo. In parallel runs the processing times are summed across worker processes.
+    """
+
+    def __init__(self, top_files=DEFAULT_TOP_FILES):
+        self.top_files = top_files
+        self.stages = {}  # name -> [wall seconds, CPU seconds]
+        self.bytes = collections.Counter()
+        self.files = collections.Counter()
+        self.skipped = collections.Counter()
+        self.warnings = collections.Counter()  # Files kept, but not as intended, per reason
+        self.slowest = []  # Min-heap of (seconds, file_path, size) holding the top_files slowest files
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def add_time(self, name, wall, cpu):
+        totals = self.stages.setdefault(name, [0.0, 0.0])
+        totals[0] += wall
+        totals[1] += cpu
+
+    def skip(self, reason, count=1):
+        if count:
+            self.skipped[reason] += count
+
+    def warn(self, reason):
+        self.warnings[reason] += 1
+
+    def record_file(self, file_path, wall, cpu, size):
+        """Record the time spent decompressing and processing a file of size uncompressed bytes."""
+        self.add_time("process", wall, cpu)
+        self.files["processed"] += 1
+        self.bytes["decompressed"] += size
+        if len(self.slowest) < self.top_files:
+            heapq.heappush(self.slowest, (wall, file_path, size))
+        elif wall > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (wall, file_path, size))
+
+    def merge(self, other):
+        for name, (wall, cpu) in other.stages.items():
+            self.add_time(name, wall, cpu)
+        self.bytes.update(other.bytes)
+        self.files.update(other.files)
+        self.skipped.update(other.skipped)
+        self.warnings.update(other.warnings)
+        for entry in other.slowest:
+            if len(self.slowest) < self.top_files:
+                heapq.heappush(self.slowest, entry)
+            elif entry[0] > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def timed_path_filter(self, path_filter):
+        """Wrap a PathFilter so that its time and the files it rejects (by extension or by path) are recorded."""
+        def timed(file_path):
+            wall, cpu = time.perf_counter(), time.process_time()
+            keep = path_filter(file_path)
+            self.add_time("filter", time.perf_counter() - wall, time.process_time() - cpu)
+            if not keep and not file_path.endswith("/"):
+                self.skip("path_filter" if file_path.endswith(path_filter.extensions) else "extension")
+            return keep
+        return timed
+
+    def to_dict(self):
+        return {
+            "stages": {name: {"wall_seconds": round(wall, 6), "cpu_seconds": round(cpu, 6)} for name, (wall, cpu) in self.stages.items()},
+            "bytes": dict(self.bytes),
+            "files": dict(self.files),
+            "skipped": dict(self.skipped),
+            "warnings": dict(self.warnings),
+            "slowest_files": [{"path": file_path, "seconds": round(wall, 6), "bytes": size}
+                              for wall, file_path, size in sorted(self.slowest, reverse=True)],
+        }
+
+    def write_report(self, report_path, **fields):
+        with open(report_path, "w", encoding="utf-8") as report_file:
+            json.dump(dict(fields, **self.to_dict()), report_file, indent=2)
+
+    def print_summary(self):
+        print("Stats:")
+        for name, (wall, cpu) in self.stages.items():
+            print(f"  {name:<10} {wall:9.3f}s wall {cpu:9.3f}s CPU")
+        print("  bytes      " + ", ".join(f"{name} {value}" for name, value in self.bytes.items()))
+        print("  files      " + ", ".join(f"{name} {value}" for name, value in self.files.items()))
+        if self.skipped:
+            print("  skipped    " + ", ".join(f"{reason} {count}" for reason, count in self.skipped.most_common()))
+        if self.warnings:
+            print("  warnings   " + ", ".join(f"{reason} {count}" for reason, count in self.warnings.most_common()))
+        for wall, file_path, size in sorted(self.slowest, reverse=True):
+            print(f"  {wall * 1000:9.1f} ms  {file_path} ({size} bytes)")
+
+class DownloadError(Exception):
+    """Raised by download_repo when the repository cannot be downloaded or opened; the message says why."""
+
+def download_repo(repo_url, output_file, lang, keep_comments=False, branch_or_tag=None, token=None, claude=False, max_memory=DEFAULT_MAX_MEMORY, jobs=1, cache=None, offline=False, transform_cache=None, session=None, include=None, exclude=None, rules=None, max_file_size=DEFAULT_MAX_FILE_SIZE, max_compression_ratio=DEFAULT_MAX_COMPRESSION_RATIO, sparse=False, incremental=False, max_tokens=0, max_bytes=0, shard=False, output_path=None, progress=None, stats=None, index=False, compress=False, stream=None, timeout=DEFAULT_TIMEOUT):
+    """
+    Download and process files from a GitHub or GitLab repository into the output_file folder.
+    Returns the path of the combined output file.
+    repo_url may also be a local directory, ZIP file or git repository, read without any network access (see
+    open_local_source). branch_or_tag defaults to main for remote repositories and to the working tree locally.
+    When an ArchiveCache is given, the archive is served from and stored in it; offline=True never touches the network.
+    When a TransformCache is given, files processed in earlier runs are served from it.
+    A shared requests.Session may be passed to reuse pooled connections across calls.
+    timeout is the number of seconds to wait for the server to connect or send more data before giving up.
+    include, exclude and rules are .gitignore-style patterns applied on top of the default path filters.
+    Files larger than max_file_size, or compressing better than max_compression_ratio, are skipped without decompressing them (0 disables either check).
+    With sparse=True, only the central directory and the matching members are fetched with HTTP Range requests.
+    With incremental=True, a sidecar manifest is kept next to the output so that later runs only process changed files.
+    max_tokens and max_bytes limit the size of the output (0 for no limit): the README and then the files ranked by
+    file_priority are packed into the budget, or with shard=True all files are split across numbered output files.
+    output_path, if given, is used instead of a file name derived from the repository in the output_file folder.
+    progress(stage, done, total) is called as the archive downloads ("download", bytes, total bytes or None) and as
+    files are processed ("process", files, total files); an exception raised from it cancels the run.
+    With a RunStats, stage timings, byte counts, skip reasons and the slowest files are recorded in it.
+    index=True writes a sidecar offset index next to the output for IndexedOutput; compress=True writes a
+    block-compressed, indexed <output>.gz instead of plain text.
+    With a binary stream, the combined output is written to it as it is produced instead of to a file, and None is
+    returned; incremental, shard, index and compress do not apply.
+    Raises DownloadError if the archive cannot be downloaded or opened, and requests.RequestException for network errors.
+    """
+    download_progress = progress
+    if stats:
+        run_started = (time.perf_counter(), time.process_time())
+
+        def download_progress(stage, done, total):
+            stats.bytes["downloaded"] = done
+            if progress:
+                progress(stage, done, total)
+
+    if os.path.exists(repo_url):
+        try:
+            zip_file = open_local_source(repo_url, ref=branch_or_tag, max_memory=max_memory)
+        except (zipfile.BadZipFile, FileNotFoundError) as e:
+            raise DownloadError(f"Could not open {repo_url}: {e}") from e
+    else:
+        branch_or_tag = branch_or_tag or "main"
+        download_url = construct_download_url(repo_url, branch_or_tag)
+        headers = token_headers(repo_url, token) if token else {}
+
+        print(download_url)
+
+        try:
+            if sparse:
+                zip_file = open_sparse_archive(download_url, headers=headers, session=session, max_memory=max_memory, progress=download_progress, timeout=timeout)
+            elif cache is not None:
+                zip_file = zipfile.ZipFile(cache.fetch(download_url, headers=headers, offline=offline, session=session, progress=download_progress, timeout=timeout))
+            else:
+                zip_file = fetch_archive(download_url, headers=headers, max_memory=max_memory, session=session, progress=download_progress, timeout=timeout)
+        except (zipfile.BadZipFile, FileNotFoundError) as e:
+            raise DownloadError(f"Could not download a valid archive of {repo_url} at {branch_or_tag}: {e}") from e
+
+    if stats:
+        stats.add_time("download", time.perf_counter() - run_started[0], time.process_time() - run_started[1])
+
+    output_file = output_path or os.path.join(output_file, get_output_name(repo_url, lang, claude))
+
+    path_filter = PathFilter(lang, include=include, exclude=exclude, rules=rules, root_prefix=get_archive_root(zip_file))
+    metadata_filter = MetadataFilter(max_file_size, max_compression_ratio)
+    output_manifest = None
+    if stream is not None:
+        incremental = shard = index = compress = False
+    if incremental and (shard or compress):
+        print("Warning: --incremental is not supported with sharded or compressed output and is ignored.")
+    elif incremental:
+        options = {"lang": lang, "keep_comments": keep_comments, "transform_version": TRANSFORM_VERSION}
+        output_manifest = OutputManifest(output_file, options, root_prefix=get_archive_root(zip_file))
+    if isinstance(zip_file.fp, HttpRangeFile):
+        candidates = iter_candidate_files(zip_file, path_filter, MetadataFilter(max_file_size, max_compression_ratio))
+        prefetch_members(zip_file, [info for info in candidates if output_manifest is None or not output_manifest.unchanged(info)])
+
+    # Written next to the output and moved into place at the end, as an incremental run reads the previous output
+    output = PackedOutput(output_file, lang, claude, max_tokens=max_tokens, max_bytes=max_bytes, shard=shard, index=index, compress=compress, stream=stream)
+
+    # When packing into a budget, the most useful files go first; sharded and unlimited output keep the archive order
+    order = file_priority if (max_tokens or max_bytes) and not shard else None
+    reuse = output_manifest.reuse if output_manifest else None
+    on_result = output_manifest.record if output_manifest else None
+    if progress:
+        total_files = sum(1 for _ in iter_candidate_files(zip_file, path_filter, MetadataFilter(max_file_size, max_compression_ratio)))
+        processed_files = 0
+
+        def on_result(info, file_content):
+            nonlocal processed_files
+            if output_manifest:
+                output_manifest.record(info, file_content)
+            processed_files += 1
+            progress("process", processed_files, total_files)
+
+    try:
+        # Include the README file
+        readme_file_path, readme_content = find_readme_content(zip_file)
+        output.add(readme_file_path, readme_content)
+
+        for file_path, file_content in iter_processed_files(zip_file, lang, keep_comments, jobs, transform_cache,
+                                                            stats.timed_path_filter(path_filter) if stats else path_filter,
+                                                            metadata_filter, reuse, on_result, order, stats):
+            if stats:
+                wall, cpu = time.perf_counter(), time.process_time()
+                location = output.add(file_path, file_content)
+                stats.add_time("write", time.perf_counter() - wall, time.process_time() - cpu)
+                stats.files["written"] += location is not None
+            else:
+                location = output.add(file_path, file_content)
+            if output_manifest and location:
+                output_manifest.record_location(file_path, *location)
+    except BaseException:
+        output.discard()
+        raise
+    finally:
+        # Also keeps what a cancelled or failed run processed, and leaves no write pending for the next run
+        if transform_cache is not None:
+            transform_cache.close()
+
+    output_paths = output.close()
+    if stats:
+        stats.bytes["written"] = sum(os.path.getsize(path) for path in output_paths)
+        stats.skip("oversized_or_generated", metadata_filter.skipped_files)
+        stats.bytes["prefilter_skipped"] = metadata_filter.skipped_bytes
+        stats.skip("budget", output.dropped_files)
+        if output_manifest:
+            stats.files["reused"] = output_manifest.reused
+        if isinstance(zip_file.fp, HttpRangeFile):
+            stats.bytes["downloaded"] = zip_file.fp.bytes_fetched
+        if transform_cache is not None:
+            stats.files["transform_cache_hits"] = transform_cache.hits
+        stats.add_time("total", time.perf_counter() - run_started[0], time.process_time() - run_started[1])
+    if output_manifest:
+        output_manifest.save()
+        print(f"Incremental refresh: reused {output_manifest.reused} unchanged files, processed {len(output_manifest.entries) - output_manifest.reused}")
+    if output.dropped_files:
+        print(f"Budget: dropped {output.dropped_files} files ({output.dropped_bytes} bytes) that did not fit")
+    if shard:
+        print(f"Sharded output: {len(output_paths)} files")
+        for path in output_paths:
+            print(f"  {path}")
+
+    if metadata_filter.skipped_files:
+        print(f"Pre-filter: skipped {metadata_filter.skipped_files} oversized or generated files ({metadata_filter.skipped_bytes} bytes) without decompressing them")
+    if isinstance(zip_file.fp, HttpRangeFile):
+        print(f"Sparse download: fetched {zip_file.fp.bytes_fetched} of {zip_file.fp.size} bytes in {zip_file.fp.requests_made} range requests")
+    if transform_cache is not None:
+        print(f"Transform cache: {transform_cache.hits} hits, {transform_cache.misses} misses")
+    return output_paths[0] if output_paths else None
+
+class RateLimitedAdapter(HTTPAdapter):
+    """HTTP adapter that spaces requests to the same host at least min_interval seconds apart."""
+
+    def __init__(self, min_interval=0.0, **kwargs):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot = {}
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if self.min_interval > 0:
+            host = urllib.parse.urlsplit(request.url).hostname
+            with self._lock:
+                now = time.monotonic()
+                slot = max(now, self._next_slot.get(host, now))
+                self._next_slot[host] = slot + self.min_interval
+            time.sleep(slot - now)
+        return super().send(request, **kwargs)
+
+def create_session(concurrency=DEFAULT_CONCURRENCY, rate_limit=0, retries=DEFAULT_RETRIES):
+    """
+    Create a pooled requests.Session shared by concurrent downloads.
+    rate_limit caps the number of requests per second to each host (0 for no limit). Connection errors, timeouts,
+    rate limited and server error responses are retried up to retries times with exponential backoff, honoring
+    Retry-After; this is the only place requests are retried.
+    """
+    retry = Retry(total=retries, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=("GET", "HEAD"), respect_retry_after_header=True, raise_on_status=False)
+    adapter = RateLimitedAdapter(1 / rate_limit if rate_limit else 0, pool_connections=concurrency, pool_maxsize=concurrency, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def parse_manifest(manifest_path, branch_or_tag="main", lang="python", token=None):
+    """
+    Parse a manifest of repositories, one per line: repo_url [branch_or_tag] [lang] [token].
+    Fields are separated by commas or whitespace; empty or missing fields take the given defaults.
+    Blank lines and lines starting with '#' are ignored.
+    """
+    entries = []
+    with open(manifest_path, encoding="utf-8") as manifest_file:
+        for line in manifest_file:
+            line = line.strip()
+            if not line or line.startswith("#"):
                 continue
-            if lang == "python" and not keep_comments:
-                file_content = remove_comments_and_docstrings(file_content)
-
-            if claude and isinstance(claude, bool):
-                outfile.write(f"<document index=\"{index}\">\n")
-                outfile.write(f"<source>{file_path}</source>\n")
-                outfile.write(f"<document_content>\n{file_content}\n</document_content>\n")
-                outfile.write("</document>\n\n")
-                index += 1
+            fields = [field.strip() for field in line.split(",")] if "," in line else line.split()
+            fields += [""] * (4 - len(fields))
+            entries.append({
+                "repo_url": fields[0],
+                "branch_or_tag": fields[1] or branch_or_tag,
+                "lang": fields[2] or lang,
+                "token": fields[3] or token,
+            })
+    return entries
+
+def run_manifest(entries, output_folder, concurrency=DEFAULT_CONCURRENCY, rate_limit=0, retries=DEFAULT_RETRIES, transform_cache_factory=None, **options):
+    """
+    Process many repositories concurrently over a shared connection pool.
+    Failed requests are retried up to retries times by the session (see create_session), and a failing
+    repository never aborts the others. When several entries would write the same output file, such as two refs
+    of one repository, their refs are added to the output names; entries that still collide fail.
+    Returns a list of (entry, output_file or None, error or None) in manifest order.
+    """
+    session = create_session(concurrency, rate_limit, retries)
+    names = [get_output_name(entry["repo_url"], entry["lang"], options.get("claude", False)) for entry in entries]
+    counts = collections.Counter(names)
+    output_paths, seen = [], set()
+    for entry, name in zip(entries, names):
+        if counts[name] > 1:
+            name = get_output_name(entry["repo_url"], entry["lang"], options.get("claude", False), entry["branch_or_tag"])
+        output_paths.append(None if name in seen else os.path.join(output_folder, name))
+        seen.add(name)
+
+    def run(entry, output_path):
+        if output_path is None:
+            return entry, None, "writes the same output file as an earlier entry of the manifest"
+        try:
+            transform_cache = transform_cache_factory() if transform_cache_factory else None
+            return entry, download_repo(output_file=output_folder, output_path=output_path, session=session, transform_cache=transform_cache, **entry, **options), None
+        except (requests.RequestException, DownloadError) as e:
+            return entry, None, str(e)
+        except Exception as e:
+            return entry, None, f"{type(e).__name__}: {e}"
+
+    with session, concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(run, entries, output_paths))
+
+def print_manifest_summary(results):
+    """Print a summary of a manifest run and return the number of failed repositories."""
+    failed = [(entry, error) for entry, output_file, error in results if error is not None]
+    print(f"Summary: {len(results) - len(failed)} succeeded, {len(failed)} failed")
+    for entry, output_file, error in results:
+        if error is None:
+            print(f"  OK     {entry['repo_url']}@{entry['branch_or_tag']} -> {output_file}")
+    for entry, error in failed:
+        print(f"  FAILED {entry['repo_url']}@{entry['branch_or_tag']}: {error}")
+    return len(failed)
+
+class StreamOutput:
+    """
+    Binary file object handed to download_repo by the server. Writes arrive on a worker thread and are passed
+    on to a ServerJob on the event loop in chunks of at least flush_size bytes.
+    """
+
+    def __init__(self, loop, job, flush_size=SERVER_FLUSH_SIZE):
+        self.loop = loop
+        self.job = job
+        self.flush_size = flush_size
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.loop.call_soon_threadsafe(self.job.append, bytes(self.buffer))
+            self.buffer = bytearray()
+
+class ServerJob:
+    """
+    One download and processing run. Its output is kept as chunks so that every request coalesced onto the job,
+    including ones arriving late, streams the whole output from the start. Once the output grows past max_replay
+    bytes the job is no longer joinable, and chunks every attached reader has sent are dropped.
+    Only touched from the event loop.
+    """
+
+    def __init__(self, max_replay=SERVER_MAX_REPLAY):
+        self.chunks = collections.deque()
+        self.first = 0  # Index in the whole output of chunks[0]
+        self.size = 0
+        self.max_replay = max_replay
+        self.done = False
+        self.error = None
+        self.readers = {}  # reader -> chunks it has sent
+        self._changed = asyncio.Event()
+
+    @property
+    def joinable(self):
+        """Whether the whole output is still kept, so that a new reader can be attached."""
+        return self.size <= self.max_replay
+
+    def attach(self):
+        reader = object()
+        self.readers[reader] = 0
+        return reader
+
+    def detach(self, reader):
+        del self.readers[reader]
+        self._trim()
+
+    def append(self, data):
+        self.chunks.append(data)
+        self.size += len(data)
+        self._trim()
+        self._notify()
+
+    def _trim(self):
+        if self.joinable:
+            return
+        sent = min(self.readers.values(), default=self.first + len(self.chunks))
+        while self.first < sent:
+            self.chunks.popleft()
+            self.first += 1
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        # Waiters hold the event that was current when they started waiting; a fresh one is used from here on
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self, count):
+        """Wait until more than count chunks were produced or the job is done."""
+        while self.first + len(self.chunks) <= count and not self.done:
+            await self._changed.wait()
+
+    async def stream(self, reader):
+        """Yield every chunk of the output to an attached reader as it is produced."""
+        while True:
+            sent = self.readers[reader]
+            await self.wait(sent)
+            if sent < self.first + len(self.chunks):
+                chunk = self.chunks[sent - self.first]
+                self.readers[reader] = sent + 1
+                self._trim()
+                yield chunk
+            elif self.done:
+                return
+
+def parse_server_options(query, allowed_hosts=DEFAULT_ALLOWED_HOSTS):
+    """
+    Turn the parsed query string of a server request into download_repo options, raising ValueError for a bad request.
+    Only http(s) URLs whose host is exactly one of allowed_hosts are accepted, never a path on the server, and at
+    most SERVER_MAX_PATTERNS include and exclude patterns of SERVER_MAX_PATTERN_LENGTH characters.
+    """
+    def value(name, default):
+        return query.get(name, [default])[-1]
+
+    def flag(name):
+        return value(name, "0").lower() in ("1", "true", "yes")
+
+    def count(name):
+        number = int(value(name, "0"))
+        if number < 0:
+            raise ValueError(f"{name} must not be negative")
+        return number
+
+    repo_url = value("repo_url", "")
+    branch_or_tag = value("branch_or_tag", "") or "main"
+    url = urllib.parse.urlsplit(repo_url)
+    if url.scheme not in ("http", "https") or (url.hostname or "").lower() not in allowed_hosts:
+        raise ValueError(f"repo_url must be the http(s) URL of a repository on {', '.join(sorted(allowed_hosts))}")
+    construct_download_url(repo_url, branch_or_tag)
+    lang = value("lang", "python")
+    if lang not in ("go", "python", "md"):
+        raise ValueError("lang must be one of go, python, md")
+    patterns = query.get("include", []) + query.get("exclude", [])
+    if len(patterns) > SERVER_MAX_PATTERNS or any(len(pattern) > SERVER_MAX_PATTERN_LENGTH for pattern in patterns):
+        raise ValueError(f"At most {SERVER_MAX_PATTERNS} include and exclude patterns of {SERVER_MAX_PATTERN_LENGTH} characters are accepted")
+    return {"repo_url": repo_url, "branch_or_tag": branch_or_tag, "lang": lang, "keep_comments": flag("keep_comments"),
+            "claude": flag("claude"), "sparse": flag("sparse"), "include": tuple(query.get("include", [])) or None,
+            "exclude": tuple(query.get("exclude", [])) or None, "max_tokens": count("max_tokens"), "max_bytes": count("max_bytes")}
+
+class ArchiveServer:
+    """
+    Long-running HTTP server exposing download_repo, so that repeated requests skip interpreter startup and share
+    the connection pool and caches. GET /?repo_url=...&branch_or_tag=...&lang=... (see parse_server_options)
+    streams the combined output back with chunked transfer encoding as it is produced; GET /status reports the
+    job queue and result cache as JSON.
+    Requests for the same repository, ref and options share one job while it runs and has produced at most
+    max_replay bytes; later ones start a job of their own. At most concurrency jobs run
+    at once and queue_size more wait; further requests get 503. Finished outputs are served from memory for
+    result_ttl seconds, evicting the least recently used beyond result_cache_size bytes. Repositories are only
+    fetched from allowed_hosts.
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, queue_size=DEFAULT_SERVER_QUEUE_SIZE, result_cache_size=DEFAULT_RESULT_CACHE_SIZE,
+                 result_ttl=DEFAULT_RESULT_CACHE_TTL, rate_limit=0, retries=DEFAULT_RETRIES, transform_cache_factory=None,
+                 allowed_hosts=DEFAULT_ALLOWED_HOSTS, max_replay=SERVER_MAX_REPLAY, **options):
+        self.allowed_hosts = frozenset(host.lower() for host in allowed_hosts)
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.result_cache_size = result_cache_size
+        self.result_ttl = result_ttl
+        self.max_replay = max_replay
+        self.transform_cache_factory = transform_cache_factory
+        self.options = options  # Passed to every download_repo call
+        self.session = create_session(concurrency, rate_limit, retries)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+        self.jobs = {}  # key -> the latest job for it
+        self.active = 0  # Jobs running or queued, including ones no longer joinable
+        self.results = collections.OrderedDict()  # key -> (expires, output), least recently used first
+        self.results_size = 0
+        self.counters = collections.Counter()
+        self._tasks = set()
+
+    async def start(self, host=DEFAULT_SERVER_HOST, port=DEFAULT_SERVER_PORT):
+        """Start listening and return the asyncio server; port 0 picks a free port."""
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), SERVER_REQUEST_TIMEOUT)
+            for _ in range(SERVER_MAX_HEADERS + 1):
+                if await asyncio.wait_for(reader.readline(), SERVER_REQUEST_TIMEOUT) in (b"\r\n", b"\n", b""):
+                    break
             else:
-                outfile.write(f"{'// ' if lang == 'go' else '# '}File: {file_path}\n")
-                outfile.write(file_content)
-                outfile.write("\n\n")
+                return await self.send(writer, 431, "Too many request headers\n")
+            parts = request_line.decode("latin-1").split()
+            if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+                return await self.send(writer, 400, "Malformed request line\n")
+            if parts[0] != "GET":
+                return await self.send(writer, 405, "Only GET is supported\n", {"Allow": "GET"})
+            target = urllib.parse.urlsplit(parts[1])
+            if target.path == "/status":
+                return await self.send(writer, 200, json.dumps(self.status()) + "\n", {"Content-Type": "application/json"})
+            if target.path != "/":
+                return await self.send(writer, 404, "Not found\n")
+            try:
+                options = parse_server_options(urllib.parse.parse_qs(target.query), self.allowed_hosts)
+            except ValueError as e:
+                return await self.send(writer, 400, f"{e}\n")
+            await self.respond(writer, options)
+        except (ConnectionError, asyncio.TimeoutError, ValueError):
+            pass  # The client went away or sent something unparseable; nothing more can be said to it
+        finally:
+            writer.close()
+
+    async def send(self, writer, status, body, headers=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        head = {"Content-Type": "text/plain; charset=utf-8", "Content-Length": str(len(body)), **(headers or {})}
+        writer.write(self._head(status, head) + body)
+        await writer.drain()
+
+    @staticmethod
+    def _head(status, headers):
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", "Connection: close"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def respond(self, writer, options):
+        key = tuple(sorted(options.items()))
+        output = self._cached_result(key)
+        if output is not None:
+            self.counters["result_cache_hits"] += 1
+            return await self.send(writer, 200, output, {"X-Cache": "hit"})
+        job = self.jobs.get(key)
+        if job is not None and job.joinable:
+            self.counters["coalesced"] += 1
+            source = "coalesced"
+        elif self.active >= self.concurrency + self.queue_size:
+            self.counters["rejected"] += 1
+            return await self.send(writer, 503, "Too many jobs queued, retry later\n", {"Retry-After": "1"})
+        else:
+            self.counters["jobs"] += 1
+            self.active += 1
+            job = self.jobs[key] = ServerJob(self.max_replay)
+            task = asyncio.get_running_loop().create_task(self.run_job(key, job, options))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            source = "miss"
+        reader = job.attach()
+        try:
+            await self.stream(writer, job, reader, source)
+        finally:
+            job.detach(reader)
+
+    async def stream(self, writer, job, reader, source):
+        # The status line waits for the first output, so that a repository that cannot be downloaded gets a 502
+        await job.wait(0)
+        if job.error and not job.size:
+            return await self.send(writer, 502, f"{job.error}\n")
+        writer.write(self._head(200, {"Content-Type": "text/plain; charset=utf-8", "Transfer-Encoding": "chunked", "X-Cache": source}))
+        async for chunk in job.stream(reader):
+            writer.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+            await writer.drain()
+        if job.error:
+            # Closing without the last chunk tells the client that the output is incomplete
+            return
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
 
-        if claude and isinstance(claude, bool):
-            outfile.write("</documents>")
+    async def run_job(self, key, job, options):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, self._download, loop, job, options)
+        except Exception as e:
+            job.finish(str(e) or type(e).__name__)
+        else:
+            job.finish()
+            if job.joinable:
+                self._store_result(key, b"".join(job.chunks))
+        finally:
+            self.active -= 1
+            if self.jobs.get(key) is job:
+                del self.jobs[key]
+
+    def _download(self, loop, job, options):
+        # Runs on a worker thread; the output reaches the job through call_soon_threadsafe, in order and
+        # before run_in_executor's own completion callback
+        stream = StreamOutput(loop, job)
+        transform_cache = self.transform_cache_factory() if self.transform_cache_factory else None
+        download_repo(output_file=".", session=self.session, transform_cache=transform_cache, stream=stream, **options, **self.options)
+        stream.flush()
+
+    def _cached_result(self, key):
+        entry = self.results.get(key)
+        if entry is None:
+            return None
+        expires, output = entry
+        if expires < time.monotonic():
+            del self.results[key]
+            self.results_size -= len(output)
+            return None
+        self.results.move_to_end(key)
+        return output
+
+    def _store_result(self, key, output):
+        if not self.result_ttl or len(output) > self.result_cache_size:
+            return
+        if key in self.results:
+            self.results_size -= len(self.results.pop(key)[1])
+        self.results[key] = (time.monotonic() + self.result_ttl, output)
+        self.results_size += len(output)
+        while self.results_size > self.result_cache_size:
+            self.results_size -= len(self.results.popitem(last=False)[1][1])
+
+    def status(self):
+        running = min(self.active, self.concurrency)
+        return {"running": running, "queued": self.active - running, "cached_results": len(self.results),
+                "cached_bytes": self.results_size, **self.counters}
+
+    async def serve_forever(self, host=DEFAULT_SERVER_HOST, port=DEFAULT_SERVER_PORT):
+        server = await self.start(host, port)
+        for sock in server.sockets:
+            print(f"Serving on http://{sock.getsockname()[0]}:{sock.getsockname()[1]}/")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
 
 def find_readme_content(zip_file):
     """
@@ -194,29 +2469,182 @@ def find_readme_content(zip_file):
 def print_usage():
     print("Usage: python github2file.py <repo_url> [--lang <language>] [--keep-comments] [--branch_or_tag <branch_or_tag>] [--claude]")
     print("Options:")
-    print("  <repo_url>               The URL of the GitHub repository")
+    print("  <repo_url>               The URL of the GitHub repository, or a local directory, ZIP file or git repository")
     print("  --lang <language>        The programming language of the repository (choices: go, python, md). Default: python")
-    print("  --keep-comments          Keep comments and docstrings in the source code (only applicable for Python)")
-    print("  --branch_or_tag <branch_or_tag>  The branch or tag of the repository to download. Default: master")
+    print("  --keep-comments          Keep comments and docstrings in the source code (Python, Go, JavaScript/TypeScript, Java, Rust and Svelte)")
+    print("  --branch_or_tag <branch_or_tag>  The branch or tag of the repository to download. Default: main (the working tree for a local checkout)")
     print("  --claude                 Format the output for Claude with document tags")
+    print("  --jobs <N>               Number of worker processes used to decompress and process files. Default: 1")
+    print("  --max-memory <MB>        Maximum archive size kept in memory before spilling to disk. Default: 32")
+    print("  --cache-dir <dir>        Directory of the persistent archive cache. Default: ~/.cache/github2file")
+    print("  --cache-size <MB>        Maximum size of the archive cache. Default: 1024")
+    print("  --transform-cache-size <MB>  Maximum size of the processed file cache. Default: 256")
+    print("  --no-cache               Always download and process everything without using the caches")
+    print("  --offline                Serve the archive strictly from the cache")
+    print("  --cache-stats            Print archive cache statistics and exit")
+    print("  --include <glob>         Only process files matching the glob (repeatable)")
+    print("  --exclude <glob>         Skip files matching the glob (repeatable)")
+    print("  --rules-file <file>      Apply .gitignore-style rules from the file")
+    print("  --max-file-size <KB>     Skip files larger than this without decompressing them (0 for no limit). Default: 1024")
+    print("  --max-compression-ratio <N>  Skip files over 64 KB that compress better than this, as they are likely generated (0 to disable). Default: 12")
+    print("  --sparse                 Fetch only the matching files with HTTP range requests instead of the whole archive")
+    print("  --max-tokens <N>         Pack the README and the most important files into about N tokens. Default: unlimited")
+    print("  --max-bytes <N>          Pack the README and the most important files into N bytes. Default: unlimited")
+    print("  --shard                  With --max-tokens/--max-bytes, split the files across numbered output files instead of dropping files")
+    print("  --incremental            Only re-process files that changed since the previous run, using a sidecar manifest")
+    print("  --index                  Write a sidecar offset index (<output>.index.jsonl) for random access to single files")
+    print("  --compress               Write an indexed, block-compressed <output>.gz instead of plain text")
+    print("  --extract <output>       Print the files of an indexed output matching --include (all files without it)")
+    print("  --list <output>          List the files of an indexed output")
+    print("  --stats                  Print stage timings, byte counts, skip reasons, warnings and the slowest files")
+    print("  --report <file>          Write the same run statistics as JSON to the file")
+    print("  --top-files <N>          Number of slowest files listed by --stats and --report. Default: 10")
+    print("  --profile <file>         Write a cProfile dump of the run to the file")
+    print("  --manifest <file>        Process every repository listed in the file (repo_url [branch_or_tag] [lang] [token] per line)")
+    print("  --concurrency <N>        Number of repositories processed concurrently with --manifest or --serve. Default: 8")
+    print("  --rate-limit <N>         Maximum requests per second to each host with --manifest or --serve. Default: unlimited")
+    print("  --retries <N>            Number of retries with exponential backoff for failed downloads. Default: 3")
+    print("  --timeout <seconds>      Seconds to wait for a server to connect or send more data before a download fails. Default: 30")
+    print("  --serve                  Run an HTTP server that streams the combined output of requested repositories")
+    print("  --host <address>         Address the server listens on. Default: 127.0.0.1")
+    print("  --port <N>               Port the server listens on. Default: 8080")
+    print("  --queue-size <N>         Number of jobs waiting for a worker before requests are rejected. Default: 16")
+    print("  --result-cache-size <MB> Maximum size of the recent outputs the server keeps in memory. Default: 256")
+    print("  --allowed-hosts <hosts>  Comma-separated hosts the server fetches repositories from, besides github.com and gitlab.com")
+    print("  --result-ttl <seconds>   How long the server answers repeated requests from memory. Default: 300")
 
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description='Download and process files from a GitHub or GitLab repository.')
-    parser.add_argument('repo_url', type=str, help='The URL of the GitHub or GitLab repository')
+    parser.add_argument('repo_url', type=str, nargs='?', help='The URL of the GitHub or GitLab repository, or a local directory, ZIP file or git repository')
     parser.add_argument('--lang', type=str, choices=['go', 'python', 'md'], default='python', help='The programming language of the repository')
-    parser.add_argument('--keep-comments', action='store_true', help='Keep comments and docstrings in the source code (only applicable for Python)')
-    parser.add_argument('--branch_or_tag', type=str, help='The branch or tag of the repository to download', default="main")
+    parser.add_argument('--keep-comments', action='store_true', help='Keep comments and docstrings in the source code (Python, Go, JavaScript/TypeScript, Java, Rust and Svelte)')
+    parser.add_argument('--branch_or_tag', type=str, help='The branch or tag of the repository to download (default: main, or the working tree of a local checkout)', default=None)
     parser.add_argument('--token', type=str, help='Personal access token for private repositories', default=None)
     parser.add_argument('--claude', action='store_true', help='Format the output for Claude with document tags')
+    parser.add_argument('--jobs', type=int, help='Number of worker processes used to decompress and process files', default=1)
+    parser.add_argument('--max-memory', type=int, help='Maximum size in MB of the downloaded archive to keep in memory before spilling to disk', default=DEFAULT_MAX_MEMORY // (1024 * 1024))
+    parser.add_argument('--cache-dir', type=str, help='Directory of the persistent archive cache', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--cache-size', type=int, help='Maximum size in MB of the archive cache', default=DEFAULT_CACHE_SIZE // (1024 * 1024))
+    parser.add_argument('--transform-cache-size', type=int, help='Maximum size in MB of the processed file cache', default=DEFAULT_TRANSFORM_CACHE_SIZE // (1024 * 1024))
+    parser.add_argument('--no-cache', action='store_true', help='Always download and process everything without using the caches')
+    parser.add_argument('--offline', action='store_true', help='Serve the archive strictly from the cache without any network access')
+    parser.add_argument('--cache-stats', action='store_true', help='Print archive cache statistics and exit')
+    parser.add_argument('--include', type=str, action='append', help='Only process files matching this glob, relative to the repository root (repeatable)', default=None)
+    parser.add_argument('--exclude', type=str, action='append', help='Skip files matching this glob, relative to the repository root (repeatable)', default=None)
+    parser.add_argument('--rules-file', type=str, help='File with .gitignore-style rules selecting the files to skip', default=None)
+    parser.add_argument('--max-file-size', type=int, help='Skip files larger than this many KB without decompressing them (0 for no limit)', default=DEFAULT_MAX_FILE_SIZE // 1024)
+    parser.add_argument('--max-compression-ratio', type=float, help='Skip files over 64 KB that compress better than this ratio, as they are likely generated (0 to disable)', default=DEFAULT_MAX_COMPRESSION_RATIO)
+    parser.add_argument('--sparse', action='store_true', help='Fetch only the matching files with HTTP range requests instead of the whole archive')
+    parser.add_argument('--max-tokens', type=int, help='Pack the README and the most important files into about this many tokens (0 for no limit)', default=0)
+    parser.add_argument('--max-bytes', type=int, help='Pack the README and the most important files into this many bytes (0 for no limit)', default=0)
+    parser.add_argument('--shard', action='store_true', help='Split the files across numbered output files that each fit --max-tokens/--max-bytes instead of dropping files (only files too large for a shard on their own are dropped)')
+    parser.add_argument('--incremental', action='store_true', help='Only re-process files that changed since the previous run, using a sidecar manifest next to the output')
+    parser.add_argument('--index', action='store_true', help='Write a sidecar offset index (<output>.index.jsonl) for random access to single files')
+    parser.add_argument('--compress', action='store_true', help='Write an indexed, block-compressed <output>.gz instead of plain text')
+    parser.add_argument('--extract', type=str, help='Print the files of an indexed output matching --include (all files without it)', default=None)
+    parser.add_argument('--list', type=str, help='List the files of an indexed output', default=None)
+    parser.add_argument('--stats', action='store_true', help='Print stage timings, byte counts, skip reasons, warnings and the slowest files')
+    parser.add_argument('--report', type=str, help='Write stage timings, byte counts, skip reasons and the slowest files as JSON to this file', default=None)
+    parser.add_argument('--top-files', type=int, help='Number of slowest files listed by --stats and --report', default=DEFAULT_TOP_FILES)
+    parser.add_argument('--profile', type=str, help='Write a cProfile dump of the run to this file', default=None)
+    parser.add_argument('--manifest', type=str, help='File listing repositories to process, one "repo_url [branch_or_tag] [lang] [token]" per line', default=None)
+    parser.add_argument('--concurrency', type=int, help='Number of repositories processed concurrently with --manifest or --serve', default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--rate-limit', type=float, help='Maximum requests per second to each host with --manifest or --serve (0 for no limit)', default=0)
+    parser.add_argument('--retries', type=int, help='Number of retries with exponential backoff for failed downloads', default=DEFAULT_RETRIES)
+    parser.add_argument('--timeout', type=float, help='Seconds to wait for a server to connect or send more data before a download fails', default=DEFAULT_TIMEOUT)
+    parser.add_argument('--serve', action='store_true', help='Run an HTTP server that streams the combined output of requested repositories')
+    parser.add_argument('--host', type=str, help='Address the --serve server listens on', default=DEFAULT_SERVER_HOST)
+    parser.add_argument('--port', type=int, help='Port the --serve server listens on', default=DEFAULT_SERVER_PORT)
+    parser.add_argument('--queue-size', type=int, help='Number of --serve jobs waiting for a worker before requests are rejected', default=DEFAULT_SERVER_QUEUE_SIZE)
+    parser.add_argument('--result-cache-size', type=int, help='Maximum size in MB of the recent outputs --serve keeps in memory', default=DEFAULT_RESULT_CACHE_SIZE // (1024 * 1024))
+    parser.add_argument('--allowed-hosts', type=str, help='Comma-separated hosts --serve fetches repositories from, besides github.com and gitlab.com', default=None)
+    parser.add_argument('--result-ttl', type=int, help='Seconds --serve answers repeated requests from memory (0 to disable)', default=DEFAULT_RESULT_CACHE_TTL)
 
     args = parser.parse_args()
+    if args.no_cache and (args.offline or args.cache_stats):
+        parser.error("--offline and --cache-stats require the archive cache")
+    if args.sparse and args.offline:
+        parser.error("--sparse cannot be combined with --offline")
+    if args.shard and not (args.max_tokens or args.max_bytes):
+        parser.error("--shard requires --max-tokens or --max-bytes")
+    if args.shard and args.incremental:
+        parser.error("--incremental cannot be combined with --shard")
+    if args.manifest and (args.stats or args.report or args.profile):
+        parser.error("--stats, --report and --profile apply to a single repository, not --manifest")
+    if args.incremental and args.compress:
+        parser.error("--incremental cannot be combined with --compress")
+    if args.serve and (args.repo_url or args.manifest or args.stats or args.report or args.profile):
+        parser.error("--serve takes its repositories from requests and cannot be combined with repo_url, --manifest, --stats, --report or --profile")
+    if args.serve and (args.incremental or args.shard or args.index or args.compress):
+        parser.error("--serve streams plain output and cannot be combined with --incremental, --shard, --index or --compress")
+    if args.extract or args.list:
+        try:
+            indexed_output = IndexedOutput(args.extract or args.list)
+        except FileNotFoundError:
+            print(f"Error: {args.extract or args.list} has no index; write it with --index or --compress.")
+            sys.exit(1)
+        if args.list:
+            for file_path in indexed_output.paths():
+                print(file_path)
+        else:
+            for file_path, file_content in indexed_output.iter_matching(args.include or ["**"]):
+                sys.stdout.write(f"{'// ' if file_path.endswith('.go') else '# '}File: {file_path}\n{file_content}\n\n")
+        sys.exit(0)
+    cache = None if args.no_cache else ArchiveCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    transform_cache = None if args.no_cache else TransformCache(args.cache_dir, args.transform_cache_size * 1024 * 1024)
+    if args.cache_stats:
+        for name, value in cache.stats().items():
+            print(f"{name}: {value}")
+        sys.exit(0)
+    if args.serve:
+        transform_cache_factory = None if args.no_cache else lambda: TransformCache(args.cache_dir, args.transform_cache_size * 1024 * 1024)
+        server = ArchiveServer(concurrency=args.concurrency, queue_size=args.queue_size, result_cache_size=args.result_cache_size * 1024 * 1024,
+                               result_ttl=args.result_ttl, rate_limit=args.rate_limit, retries=args.retries,
+                               transform_cache_factory=transform_cache_factory, token=args.token,
+                               allowed_hosts=DEFAULT_ALLOWED_HOSTS | {host.strip() for host in (args.allowed_hosts or "").split(",") if host.strip()}, max_memory=args.max_memory * 1024 * 1024,
+                               jobs=args.jobs, cache=cache, offline=args.offline, rules=read_rules_file(args.rules_file) if args.rules_file else None,
+                               max_file_size=args.max_file_size * 1024, max_compression_ratio=args.max_compression_ratio,
+                               timeout=args.timeout)
+        try:
+            asyncio.run(server.serve_forever(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+    if not args.repo_url and not args.manifest:
+        parser.error("the following arguments are required: repo_url")
+
     output_folder = "repos"
     os.makedirs(output_folder, exist_ok=True)
-    output_file_base = f"{args.repo_url.split('/')[-1]}_{args.lang}.txt"
-    output_file = output_file_base if not args.claude else f"{output_file_base}-claude.txt"
+    path_options = {"include": args.include, "exclude": args.exclude, "rules": read_rules_file(args.rules_file) if args.rules_file else None,
+                    "max_file_size": args.max_file_size * 1024, "max_compression_ratio": args.max_compression_ratio, "sparse": args.sparse,
+                    "incremental": args.incremental, "max_tokens": args.max_tokens, "max_bytes": args.max_bytes, "shard": args.shard,
+                    "index": args.index, "compress": args.compress, "timeout": args.timeout}
+
+    if args.manifest:
+        entries = parse_manifest(args.manifest, branch_or_tag=args.branch_or_tag or "main", lang=args.lang, token=args.token)
+        transform_cache_factory = None if args.no_cache else lambda: TransformCache(args.cache_dir, args.transform_cache_size * 1024 * 1024)
+        results = run_manifest(entries, output_folder, concurrency=args.concurrency, rate_limit=args.rate_limit, retries=args.retries,
+                               transform_cache_factory=transform_cache_factory, keep_comments=args.keep_comments, claude=args.claude,
+                               max_memory=args.max_memory * 1024 * 1024, jobs=args.jobs, cache=cache, offline=args.offline, **path_options)
+        sys.exit(1 if print_manifest_summary(results) else 0)
 
-    download_repo(repo_url=args.repo_url, output_file=output_folder, lang=args.lang, keep_comments=args.keep_comments, branch_or_tag=args.branch_or_tag, token=args.token, claude=args.claude)
+    stats = RunStats(args.top_files) if args.stats or args.report else None
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    try:
+        output_file = download_repo(repo_url=args.repo_url, output_file=output_folder, lang=args.lang, keep_comments=args.keep_comments, branch_or_tag=args.branch_or_tag, token=args.token, claude=args.claude, max_memory=args.max_memory * 1024 * 1024, jobs=args.jobs, cache=cache, offline=args.offline, transform_cache=transform_cache, stats=stats, **path_options)
+    except DownloadError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+    if args.stats:
+        stats.print_summary()
+    if args.report:
+        stats.write_report(args.report, repo_url=args.repo_url, branch_or_tag=args.branch_or_tag, lang=args.lang, jobs=args.jobs, output_file=output_file)
 
     print(f"Combined {args.lang.capitalize()} source code saved to {output_file}")
 
@@ -0,0 +1,37 @@
+import contextlib
+import http.server
+import os
+import shutil
+import sys
+import threading
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+def publish_archive(root, name, archive_path, branch_or_tag="main"):
+    """
+    Place archive_path under root where construct_download_url looks for the GitHub repository u/<name>,
+    and return the repository path to append to the URL of a server for root.
+    """
+    target = os.path.join(root, "github.com", "u", name, "archive", "refs", "heads", f"{branch_or_tag}.zip")
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.copyfile(archive_path, target)
+    return f"github.com/u/{name}"
+
+class PlainRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Static file handler that ignores Range headers, like servers without range support."""
+
+    def log_message(self, format, *args):
+        pass
+
+@contextlib.contextmanager
+def serve_without_ranges(directory):
+    """Serve directory over HTTP without range support on a free local port and yield the base URL."""
+    handler = lambda *args, **kwargs: PlainRequestHandler(*args, directory=directory, **kwargs)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
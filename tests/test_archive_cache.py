@@ -0,0 +1,72 @@
+import os
+import time
+import zipfile
+
+import pytest
+
+import benchmark
+import github2file
+from conftest import publish_archive
+
+@pytest.fixture
+def archive_root(tmp_path):
+    root = tmp_path / "srv"
+    for seed, name in enumerate(["alpha", "beta", "gamma"]):
+        publish_archive(root, name, benchmark.generate_archive(tmp_path / f"{name}.zip", files=30, seed=seed))
+    return root
+
+def download_url(base_url, name):
+    return github2file.construct_download_url(f"{base_url}/github.com/u/{name}", "main")
+
+def test_unchanged_archives_are_revalidated(tmp_path, archive_root):
+    cache = github2file.ArchiveCache(str(tmp_path / "cache"))
+    with benchmark.serve_directory(str(archive_root)) as base_url:
+        first = cache.fetch(download_url(base_url, "alpha"))
+        second = cache.fetch(download_url(base_url, "alpha"))
+        assert first == second
+        assert (cache.stats()["misses"], cache.stats()["revalidated"]) == (1, 1)
+        assert cache.stats()["bytes_saved"] == os.path.getsize(first)
+
+        # A newer archive on the server is downloaded again instead of answered with 304
+        published = archive_root / "github.com/u/alpha/archive/refs/heads/main.zip"
+        benchmark.generate_archive(published, files=31, seed=9)
+        os.utime(published, (time.time() + 10, time.time() + 10))
+        assert cache.fetch(download_url(base_url, "alpha")) == first
+        assert cache.stats()["misses"] == 2
+        assert open(first, "rb").read() == published.read_bytes()
+
+def test_offline_hits_and_misses(tmp_path, archive_root):
+    cache = github2file.ArchiveCache(str(tmp_path / "cache"))
+    with benchmark.serve_directory(str(archive_root)) as base_url:
+        cached = cache.fetch(download_url(base_url, "alpha"))
+    # The server is gone, so only the cache can answer
+    assert cache.fetch(download_url(base_url, "alpha"), offline=True) == cached
+    assert cache.stats()["hits"] == 1
+    with pytest.raises(FileNotFoundError):
+        cache.fetch(download_url(base_url, "beta"), offline=True)
+    assert cache.stats()["misses"] == 1
+
+def test_least_recently_used_archives_are_evicted(tmp_path, archive_root):
+    with benchmark.serve_directory(str(archive_root)) as base_url:
+        sizes = [os.path.getsize(archive_root / f"github.com/u/{name}/archive/refs/heads/main.zip") for name in ("alpha", "beta", "gamma")]
+        cache = github2file.ArchiveCache(str(tmp_path / "cache"), max_size=sum(sizes) - min(sizes) // 2)
+        alpha = cache.fetch(download_url(base_url, "alpha"))
+        beta = cache.fetch(download_url(base_url, "beta"))
+        cache.fetch(download_url(base_url, "alpha"))  # Revalidating alpha makes beta the least recently used
+        gamma = cache.fetch(download_url(base_url, "gamma"))
+    assert os.path.exists(alpha) and os.path.exists(gamma)
+    assert not os.path.exists(beta) and not os.path.exists(beta[:-len(".zip")] + ".json")
+    assert cache.stats()["evictions"] == 1 and cache.stats()["entries"] == 2
+
+def test_error_pages_are_never_cached(tmp_path, archive_root):
+    not_a_zip = archive_root / "github.com/u/html/archive/refs/heads/main.zip"
+    not_a_zip.parent.mkdir(parents=True)
+    not_a_zip.write_text("<html>Rate limit exceeded</html>")
+    cache = github2file.ArchiveCache(str(tmp_path / "cache"))
+    with benchmark.serve_directory(str(archive_root)) as base_url:
+        for name in ("missing", "html"):
+            with pytest.raises(zipfile.BadZipFile):
+                cache.fetch(download_url(base_url, name))
+    assert os.listdir(cache.cache_dir) == []
+    with pytest.raises(FileNotFoundError):
+        cache.fetch(download_url(base_url, "html"), offline=True)
@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+import github2file
+
+def strip_js(source):
+    return github2file.strip_c_like_comments(source, "javascript")
+
+@pytest.mark.parametrize("strip, source", [
+    (strip_js, "=/[" * 100000),
+    (strip_js, "(/" * 150000),
+    (github2file.strip_svelte_comments, "<script>" * 40000),
+    (github2file.strip_svelte_comments, "<script " * 40000),
+    (github2file.strip_svelte_comments, "<style><!--" * 30000),
+])
+def test_long_lines_strip_in_linear_time(strip, source):
+    started = time.perf_counter()
+    strip(source)
+    strip(source[:len(source) // 4])
+    # Quadratic lexers took minutes on these; linear ones take well under a second
+    assert time.perf_counter() - started < 5
+
+def test_regex_literals_and_divisions():
+    source = "a = b / c // one\nr = /\\/\\/[/]/g.test(s) // two\nz = y.return / 2 // three\nreturn /x/ // four\n"
+    assert strip_js(source) == "a = b / c\nr = /\\/\\/[/]/g.test(s)\nz = y.return / 2\nreturn /x/\n"
+
+def test_unterminated_regex_keeps_scanning_the_line():
+    assert strip_js("x = (/[ y // comment\nz = 1\n") == "x = (/[ y\nz = 1\n"
+
+def test_crlf_line_endings_are_kept():
+    assert strip_js("x = 1 // a\r\ny = 2\r\n// whole line\r\nz = 3\r\n") == "x = 1\r\ny = 2\r\nz = 3\r\n"
+
+def test_go_directives_and_cgo_preamble_are_kept():
+    source = ('//go:build linux\n// +build linux\n\n// Package p does things.\npackage p\n\n'
+              '// #include <stdio.h>\n// #cgo LDFLAGS: -lm\nimport "C"\n\n'
+              '//go:embed data.txt\nvar data string // trailing\n\n//export Add\nfunc Add() {} /* done */\n')
+    assert github2file.strip_go_comments(source) == ('//go:build linux\n// +build linux\n\npackage p\n\n'
+                                                     '// #include <stdio.h>\n// #cgo LDFLAGS: -lm\nimport "C"\n\n'
+                                                     '//go:embed data.txt\nvar data string\n\n//export Add\nfunc Add() {}\n')
+
+def test_go_comment_separated_from_import_c_is_removed():
+    assert github2file.strip_go_comments('// unrelated\n\nimport "C"\n') == '\nimport "C"\n'
+
+def test_svelte_sections():
+    source = '<script>\n// code comment\nlet a = 1;\n</script>\n<!-- markup comment -->\n<p>{a}</p>\n<style>\np { color: red; } /* css */\n</style>\n'
+    assert github2file.strip_svelte_comments(source) == '<script>\nlet a = 1;\n</script>\n<p>{a}</p>\n<style>\np { color: red; }\n</style>\n'
+
+def test_svelte_unclosed_script_runs_to_end_of_file():
+    assert github2file.strip_svelte_comments("<p>x</p>\n<script>\nlet a = 1; // c\n<!-- not markup -->") == "<p>x</p>\n<script>\nlet a = 1;\n<!-- not markup -->"
+
+def test_deeply_nested_template_substitutions():
+    depth = 5000
+    source = "const x = " + "`${" * depth + "a /* c */" + "}`" * depth + "; // trailing\n"
+    assert strip_js(source) == "const x = " + "`${" * depth + "a " + "}`" * depth + ";\n"
+
+def test_failing_stripper_keeps_the_file(monkeypatch, capsys):
+    def broken(file_path, source):
+        raise RecursionError("maximum recursion depth exceeded")
+
+    monkeypatch.setitem(github2file.COMMENT_STRIPPERS, ".js", broken)
+    source = "const x = 1; // comment\n"
+    assert github2file.strip_comments("src/a.js", source) is source
+    assert "Keeping comments in src/a.js" in capsys.readouterr().out
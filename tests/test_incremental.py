@@ -0,0 +1,69 @@
+import os
+import random
+import zipfile
+
+import pytest
+
+import benchmark
+import github2file
+from conftest import publish_archive
+
+REVISIONS = 4
+
+def archive_revisions(tmp_path, seed=0):
+    """
+    Yield the paths of successive revisions of a synthetic repository. Each revision edits, deletes and adds
+    a few files and sometimes the README, leaving most files unchanged.
+    """
+    rng = random.Random(seed)
+    with zipfile.ZipFile(benchmark.generate_archive(tmp_path / "base.zip", files=150, mix="python=1", seed=seed)) as base:
+        files = {name: base.read(name) for name in base.namelist()}
+    for revision in range(REVISIONS):
+        if revision:
+            sources = [name for name in files if name.endswith(".py")]
+            for name in rng.sample(sources, 8):
+                files[name] += f"\n\ndef revision_{revision}():\n    return {revision}  # edited\n".encode()
+            for name in rng.sample(sources, 4):
+                del files[name]
+            for index in range(4):
+                files[f"bench-main/src/added/rev{revision}_{index}.py"] = benchmark.make_python_file(rng, 3).encode()
+            if revision % 2:
+                files["bench-main/README.md"] += f"\nRevision {revision}.\n".encode()
+        path = tmp_path / f"rev{revision}.zip"
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, data in files.items():
+                archive.writestr(name, data)
+        yield path
+
+@pytest.mark.parametrize("jobs", [1, 2])
+@pytest.mark.parametrize("claude", [False, True])
+@pytest.mark.parametrize("max_tokens", [0, 20000])
+def test_incremental_matches_full_rebuild(tmp_path, claude, jobs, max_tokens):
+    root = tmp_path / "srv"
+    incremental_output = str(tmp_path / "incremental.txt")
+    options = {"claude": claude, "jobs": jobs, "max_tokens": max_tokens}
+    with benchmark.serve_directory(str(root)) as base_url:
+        for revision, archive in enumerate(archive_revisions(tmp_path)):
+            repo_url = f"{base_url}/{publish_archive(root, 'repo', archive)}"
+            full_output = str(tmp_path / f"full{revision}.txt")
+            github2file.download_repo(repo_url, str(tmp_path), "python", output_path=full_output, **options)
+            stats = github2file.RunStats()
+            github2file.download_repo(repo_url, str(tmp_path), "python", output_path=incremental_output, incremental=True, stats=stats, **options)
+            with open(full_output, "rb") as full, open(incremental_output, "rb") as incremental:
+                assert incremental.read() == full.read(), f"revision {revision}"
+            if revision:
+                assert stats.files["reused"] > 50
+    assert os.path.exists(incremental_output + ".manifest.json")
+
+def test_changed_options_rebuild(tmp_path):
+    root = tmp_path / "srv"
+    archive = next(archive_revisions(tmp_path))
+    output = str(tmp_path / "out.txt")
+    with benchmark.serve_directory(str(root)) as base_url:
+        repo_url = f"{base_url}/{publish_archive(root, 'repo', archive)}"
+        github2file.download_repo(repo_url, str(tmp_path), "python", output_path=output, incremental=True)
+        stats = github2file.RunStats()
+        github2file.download_repo(repo_url, str(tmp_path), "python", output_path=output, incremental=True, keep_comments=True, stats=stats)
+        github2file.download_repo(repo_url, str(tmp_path), "python", output_path=str(tmp_path / "full.txt"), keep_comments=True)
+    assert stats.files["reused"] == 0
+    assert open(output, "rb").read() == open(tmp_path / "full.txt", "rb").read()
@@ -0,0 +1,83 @@
+import gzip
+import json
+import os
+import re
+
+import pytest
+
+import benchmark
+import github2file
+
+DOCUMENT = re.compile(r'<document index="\d+">\n<source>(.*?)</source>\n<document_content>\n(.*?)\n</document_content>', re.S)
+
+@pytest.fixture(scope="module")
+def outputs(tmp_path_factory):
+    """The same repository written as plain, indexed, compressed and sharded indexed output, with its files by path."""
+    tmp_path = tmp_path_factory.mktemp("indexed")
+    archive = str(benchmark.generate_archive(tmp_path / "repo.zip", files=1500, mix="python=0.7,go=0.3"))
+
+    def run(name, **options):
+        return github2file.download_repo(archive, str(tmp_path), "python", claude=True, output_path=str(tmp_path / f"{name}.txt"), **options)
+
+    plain = run("plain")
+    files = dict(DOCUMENT.findall(open(plain, encoding="utf-8").read()))
+    run("sharded", index=True, max_tokens=20000, shard=True)
+    shards = sorted((str(tmp_path / name) for name in os.listdir(tmp_path) if re.fullmatch(r"sharded-\d+\.txt", name)),
+                    key=lambda path: int(re.search(r"-(\d+)\.txt$", path).group(1)))
+    return {"files": files, "plain": plain, "indexed": run("indexed", index=True), "compressed": run("compressed", compress=True), "shards": shards}
+
+def test_compressed_output_is_a_valid_gzip_file_of_the_plain_output(outputs):
+    assert outputs["compressed"].endswith(".txt.gz")
+    with open(outputs["compressed"], "rb") as compressed, open(outputs["plain"], "rb") as plain:
+        assert gzip.decompress(compressed.read()) == plain.read()
+    with open(outputs["compressed"] + ".index.jsonl", encoding="utf-8") as index_file:
+        members = {json.loads(line)["block_offset"] for line in index_file}
+    assert len(members) > 2
+
+@pytest.mark.parametrize("kind", ["indexed", "compressed"])
+def test_every_indexed_file_reads_back_identical(outputs, kind):
+    indexed_output = github2file.IndexedOutput(outputs[kind])
+    assert indexed_output.paths() == list(outputs["files"])
+    for file_path, content in outputs["files"].items():
+        assert indexed_output.read(file_path) == content
+    matching = dict(indexed_output.iter_matching(["src/pkg1*/**"]))
+    assert matching and matching == {path: content for path, content in outputs["files"].items() if re.match(r"bench-main/src/pkg1[^/]*/", path)}
+
+def test_sharded_indexes_cover_every_file(outputs):
+    assert len(outputs["shards"]) > 2
+    read_back = {}
+    for shard in outputs["shards"]:
+        read_back.update(github2file.IndexedOutput(shard).iter_matching(["**"]))
+    assert read_back == outputs["files"]
+
+def test_block_gzip_members_start_at_checkpoints(tmp_path):
+    chunks = [f"chunk {index} ".encode("ascii") * 50 for index in range(200)]
+    with open(tmp_path / "blocks.gz", "wb") as raw:
+        block_file = github2file.BlockGzipFile(raw, block_size=4096)
+        starts = []
+        for chunk in chunks:
+            starts.append((block_file.checkpoint(), block_file.position))
+            block_file.write(chunk)
+        block_file.close()
+    data = (tmp_path / "blocks.gz").read_bytes()
+    assert gzip.decompress(data) == b"".join(chunks)
+    for chunk, ((member_offset, member_start), position) in zip(chunks, starts):
+        # Decompressing from the member's offset reaches the chunk at its position
+        assert gzip.decompress(data[member_offset:])[position - member_start:].startswith(chunk)
+    assert len({member_offset for (member_offset, _), _ in starts}) > 10
+
+def test_tampered_entries_raise(tmp_path, outputs):
+    indexed_output = github2file.IndexedOutput(outputs["indexed"])
+    entry = next(entry for entry in indexed_output.entries if entry["length"] > 10)
+    tampered = tmp_path / "tampered.txt"
+    data = bytearray(open(outputs["indexed"], "rb").read())
+    data[entry["offset"] + 5] ^= 0x01
+    tampered.write_bytes(bytes(data))
+    os.link(outputs["indexed"] + ".index.jsonl", str(tampered) + ".index.jsonl")
+    with pytest.raises(ValueError, match="does not match its index"):
+        github2file.IndexedOutput(str(tampered)).read(entry["path"])
+
+    compressed = github2file.IndexedOutput(outputs["compressed"])
+    compressed._by_path[entry["path"]]["sha256"] = "0" * 64
+    with pytest.raises(ValueError, match="does not match its index"):
+        compressed.read(entry["path"])
@@ -0,0 +1,75 @@
+import random
+import re
+import subprocess
+
+import pytest
+
+import benchmark
+import github2file
+
+def git(repo, *args):
+    subprocess.run(["git", "-C", str(repo), "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+                   check=True, capture_output=True)
+
+def write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+
+@pytest.fixture
+def checkout(tmp_path):
+    """A git checkout with nested .gitignore files, a dev branch and an uncommitted change on main."""
+    if github2file.run_git(str(tmp_path), "--version") is None:
+        pytest.skip("git is not installed")
+    rng = random.Random(0)
+    repo = tmp_path / "proj"
+    write(repo / "README.md", "# Project\n")
+    for name in ["src/core.py", "src/io/reader.py", "src/x_local.py", "src/keep_local.py", "pkg/util_helpers.py", "build/gen.py", ".venv/lib.py"]:
+        write(repo / name, benchmark.make_python_file(rng, 3))
+    write(repo / ".gitignore", "build/\n.venv/\n")
+    write(repo / "src/.gitignore", "*_local.py\n!keep_local.py\n")
+    git(repo, "init", "-q", "-b", "main")
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", "initial")
+    git(repo, "checkout", "-q", "-b", "dev")
+    write(repo / "src/dev_only.py", benchmark.make_python_file(rng, 3))
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", "dev")
+    git(repo, "checkout", "-q", "main")
+    return repo
+
+def normalized(output_path):
+    """The output with the archive's top-level folder removed from every file header, as it differs between sources."""
+    return re.sub(r"^# File: [^/\n]+/", "# File: ", open(output_path, encoding="utf-8").read(), flags=re.M)
+
+def run(source, tmp_path, name, **options):
+    return normalized(github2file.download_repo(str(source), str(tmp_path), "python", output_path=str(tmp_path / f"{name}.txt"), **options))
+
+def test_directory_walk_honors_nested_gitignore_files(checkout):
+    names = github2file.DirectorySource(str(checkout)).namelist()
+    assert "proj/src/core.py" in names and "proj/src/io/reader.py" in names
+    assert "proj/src/keep_local.py" in names  # Re-included by the negation in src/.gitignore
+    assert "proj/src/x_local.py" not in names
+    assert not any(name.startswith(("proj/build/", "proj/.venv/", "proj/.git/")) for name in names)
+
+def test_directory_ref_bare_and_zip_sources_agree(tmp_path, checkout):
+    subprocess.run(["git", "clone", "-q", "--bare", str(checkout), str(tmp_path / "proj.git")], check=True)
+    subprocess.run(["git", "-C", str(checkout), "archive", "--format=zip", "--prefix=proj-main/", "-o", str(tmp_path / "proj.zip"), "main"], check=True)
+    working_tree = run(checkout, tmp_path, "tree")
+    assert run(checkout, tmp_path, "ref", branch_or_tag="main") == working_tree
+    assert run(tmp_path / "proj.git", tmp_path, "bare") == working_tree
+    assert run(tmp_path / "proj.zip", tmp_path, "zip") == working_tree
+    assert "# File: src/keep_local.py" in working_tree and "src/x_local.py" not in working_tree
+
+def test_refs_and_uncommitted_changes(tmp_path, checkout):
+    assert "src/dev_only.py" in run(checkout, tmp_path, "dev", branch_or_tag="dev")
+    assert "src/dev_only.py" not in run(checkout, tmp_path, "main", branch_or_tag="main")
+    write(checkout / "src/new.py", benchmark.make_python_file(random.Random(1), 3))
+    assert "# File: src/new.py" in run(checkout, tmp_path, "tree")
+    assert "src/new.py" not in run(checkout, tmp_path, "head", branch_or_tag="HEAD")
+
+def test_bad_local_sources(tmp_path, checkout):
+    with pytest.raises(github2file.DownloadError, match="missing-branch"):
+        github2file.download_repo(str(checkout), str(tmp_path), "python", branch_or_tag="missing-branch")
+    (tmp_path / "broken.zip").write_bytes(b"not a zip")
+    with pytest.raises(github2file.DownloadError):
+        github2file.download_repo(str(tmp_path / "broken.zip"), str(tmp_path), "python")
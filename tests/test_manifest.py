@@ -0,0 +1,112 @@
+import contextlib
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+import benchmark
+import github2file
+from conftest import publish_archive
+
+@pytest.fixture
+def fixture_server(tmp_path):
+    """Serve two small repositories, alpha and beta, and yield the server URL."""
+    root = tmp_path / "srv"
+    for seed, name in enumerate(["alpha", "beta"]):
+        publish_archive(root, name, benchmark.generate_archive(tmp_path / f"{name}.zip", files=40, seed=seed))
+    with benchmark.serve_directory(str(root)) as base_url:
+        yield base_url
+
+@pytest.fixture
+def stalled_url():
+    """URL of a server that accepts connections and never answers."""
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(16)
+    yield f"http://127.0.0.1:{listener.getsockname()[1]}/github.com/u/stalled"
+    listener.close()
+
+def output_folder(tmp_path, name):
+    path = tmp_path / name
+    path.mkdir(exist_ok=True)
+    return str(path)
+
+def write_manifest(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return github2file.parse_manifest(str(path))
+
+def test_manifest_processes_every_repository(tmp_path, fixture_server):
+    entries = write_manifest(tmp_path / "repos.txt", ["# fixtures", f"{fixture_server}/github.com/u/alpha",
+                                                      f"{fixture_server}/github.com/u/beta, main, python"])
+    results = github2file.run_manifest(entries, output_folder(tmp_path, "out"), concurrency=2, retries=0)
+    assert [error for _, _, error in results] == [None, None]
+    for entry, output_file, _ in results:
+        expected = github2file.download_repo(entry["repo_url"], output_folder(tmp_path, "single"), "python")
+        assert open(output_file, "rb").read() == open(expected, "rb").read()
+
+def test_failures_and_stalled_hosts_do_not_block_the_rest(tmp_path, fixture_server, stalled_url):
+    entries = write_manifest(tmp_path / "repos.txt", [stalled_url, f"{fixture_server}/github.com/u/missing", f"{fixture_server}/github.com/u/alpha"])
+    started = time.monotonic()
+    results = github2file.run_manifest(entries, output_folder(tmp_path, "out"), concurrency=3, retries=1, timeout=0.5)
+    assert time.monotonic() - started < 30
+    (_, _, stalled_error), (_, _, missing_error), (_, alpha_output, alpha_error) = results
+    assert "timed out" in stalled_error
+    assert "HTTP 404" in missing_error
+    assert alpha_error is None and alpha_output.endswith("alpha_python.txt")
+    assert github2file.print_manifest_summary(results) == 2
+
+def test_worker_processes_under_manifest_threads(tmp_path, fixture_server):
+    entries = write_manifest(tmp_path / "repos.txt", [f"{fixture_server}/github.com/u/alpha", f"{fixture_server}/github.com/u/beta"])
+    single = github2file.run_manifest(entries, output_folder(tmp_path, "single"), concurrency=2, retries=0, jobs=1)
+    pooled = github2file.run_manifest(entries, output_folder(tmp_path, "pooled"), concurrency=2, retries=0, jobs=2)
+    for (_, single_output, _), (_, pooled_output, pooled_error) in zip(single, pooled):
+        assert pooled_error is None
+        assert open(single_output, "rb").read() == open(pooled_output, "rb").read()
+
+def test_download_errors_carry_the_cause(tmp_path, fixture_server):
+    with pytest.raises(github2file.DownloadError, match="HTTP 404"):
+        github2file.download_repo(f"{fixture_server}/github.com/u/missing", str(tmp_path), "python")
+    with pytest.raises(github2file.DownloadError, match="not in the archive cache"):
+        github2file.download_repo(f"{fixture_server}/github.com/u/alpha", str(tmp_path), "python",
+                                  cache=github2file.ArchiveCache(str(tmp_path / "cache")), offline=True)
+    with pytest.raises(github2file.DownloadError, match="is not a git repository"):
+        github2file.download_repo(str(tmp_path), str(tmp_path), "python", branch_or_tag="main")
+
+def test_requests_are_retried_at_one_level(tmp_path):
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(16)
+    connections = []
+
+    def accept():
+        # Accept and hold every connection without ever answering
+        with contextlib.suppress(OSError):
+            while True:
+                connections.append(listener.accept()[0])
+
+    threading.Thread(target=accept, daemon=True).start()
+    entries = write_manifest(tmp_path / "repos.txt", [f"http://127.0.0.1:{listener.getsockname()[1]}/github.com/u/stalled"])
+    try:
+        (_, _, error), = github2file.run_manifest(entries, output_folder(tmp_path, "out"), retries=2, timeout=0.3)
+    finally:
+        listener.close()
+        for connection in connections:
+            connection.close()
+    assert "timed out" in error
+    assert len(connections) == 3
+
+def test_refs_of_one_repository_get_their_own_outputs(tmp_path, fixture_server):
+    publish_archive(tmp_path / "srv", "alpha", benchmark.generate_archive(tmp_path / "alpha-dev.zip", files=40, seed=7), "dev")
+    alpha = f"{fixture_server}/github.com/u/alpha"
+    entries = write_manifest(tmp_path / "repos.txt", [f"{alpha}, main", f"{alpha}, dev", f"{alpha}, dev", f"{fixture_server}/github.com/u/beta"])
+    results = github2file.run_manifest(entries, output_folder(tmp_path, "out"), concurrency=4, retries=0)
+    (_, main_output, main_error), (_, dev_output, dev_error), (_, _, duplicate_error), (_, beta_output, _) = results
+    assert main_error is None and dev_error is None
+    assert "same output file" in duplicate_error
+    assert [os.path.basename(path) for path in (main_output, dev_output, beta_output)] == ["alpha@main_python.txt", "alpha@dev_python.txt", "beta_python.txt"]
+    for ref, output_file in (("main", main_output), ("dev", dev_output)):
+        expected = github2file.download_repo(alpha, output_folder(tmp_path, f"single-{ref}"), "python", branch_or_tag=ref)
+        assert open(output_file, "rb").read() == open(expected, "rb").read()
+    assert [name for name in os.listdir(tmp_path / "out") if name.endswith(".part")] == []
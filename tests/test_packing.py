@@ -0,0 +1,47 @@
+import os
+import random
+import re
+import zipfile
+
+import pytest
+
+import benchmark
+import github2file
+
+DOCUMENT = re.compile(r'<document index="(\d+)">\n<source>(.*?)</source>\n<document_content>\n(.*?)\n</document_content>', re.S)
+
+@pytest.fixture
+def archive(tmp_path):
+    archive_path = benchmark.generate_archive(tmp_path / "repo.zip", files=150, mix="python=1", seed=4)
+    with zipfile.ZipFile(archive_path, "a", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr("bench-main/src/huge.py", benchmark.make_python_file(random.Random(0), 1500))
+    return str(archive_path)
+
+def documents(paths):
+    return [match.groups() for path in paths for match in DOCUMENT.finditer(open(path, encoding="utf-8").read())]
+
+def test_shards_keep_every_file_that_fits_a_shard(tmp_path, archive, capsys):
+    # The huge file compresses too well for the default pre-filter, which would skip it before packing
+    options = {"claude": True, "max_compression_ratio": 0}
+    unlimited = documents([github2file.download_repo(archive, str(tmp_path), "python", output_path=str(tmp_path / "all.txt"), **options)])
+    first = github2file.download_repo(archive, str(tmp_path), "python", max_tokens=5000, shard=True, output_path=str(tmp_path / "out.txt"), **options)
+    assert first == str(tmp_path / "out-1.txt")
+    shards = sorted((str(tmp_path / name) for name in os.listdir(tmp_path) if re.fullmatch(r"out-\d+\.txt", name)),
+                    key=lambda path: int(re.search(r"-(\d+)\.txt$", path).group(1)))
+    assert len(shards) > 3
+    assert all(github2file.estimate_tokens(os.path.getsize(path)) <= 5000 for path in shards)
+
+    sharded = documents(shards)
+    # Indices continue across shards, and only the file too large for any shard is missing
+    assert [int(index) for index, _, _ in sharded] == list(range(len(sharded)))
+    assert [(source, content) for _, source, content in sharded] == [(source, content) for _, source, content in unlimited if source != "bench-main/src/huge.py"]
+    assert len(sharded) == len(unlimited) - 1
+    assert "Warning: Dropping bench-main/src/huge.py" in capsys.readouterr().out
+
+def test_budget_without_shards_keeps_the_most_important_files(tmp_path, archive):
+    output = github2file.download_repo(archive, str(tmp_path), "python", max_bytes=30000, output_path=str(tmp_path / "packed.txt"))
+    assert os.path.getsize(output) <= 30000
+    sources = re.findall(r"^# File: (.*)$", open(output, encoding="utf-8").read(), re.M)
+    assert sources[0] == "bench-main/README.md"
+    depths = [source.count("/") for source in sources[1:]]
+    assert depths == sorted(depths)
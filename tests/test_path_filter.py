@@ -0,0 +1,94 @@
+import random
+import re
+import time
+
+import pytest
+
+import github2file
+
+@pytest.mark.parametrize("pattern, path, expected", [
+    ("*.py", "a/b/c.py", True),
+    ("*.py", "a/b/c.pyc", False),
+    ("src/*.py", "src/a.py", True),
+    ("src/*.py", "src/a/b.py", False),
+    ("src/**", "src/a/b.py", True),
+    ("src/**", "src", False),
+    ("**/gen/*.py", "gen/a.py", True),
+    ("**/gen/*.py", "a/b/gen/a.py", True),
+    ("a/**/b", "a/b", True),
+    ("a/**/b", "a/x/y/b/c.py", True),
+    ("a/**/**/b", "a/x/b", True),
+    ("build/", "build", False),
+    ("build/", "x/build/a.py", True),
+    ("/vendor", "vendor/a.go", True),
+    ("/vendor", "x/vendor/a.go", False),
+    ("a**b.py", "a/x/b.py", False),
+    ("a**b.py", "axb.py", True),
+    ("[!a]*.py", "b.py", True),
+    ("[!a]*.py", "a.py", False),
+    ("f?o.py", "f/o.py", False),
+    ("*_pb2*.py", "api/v1/x_pb2_grpc.py", True),
+])
+def test_glob_semantics(pattern, path, expected):
+    assert bool(re.fullmatch(github2file.glob_to_regex(pattern), path)) == expected
+
+@pytest.mark.parametrize("pattern", [
+    "**/" * 10 + "z.py",
+    "**/d*/**/d*/**/d*/**/d*/**/z",
+    "d" + "**d" * 8 + "**z",
+    "*d" * 12 + "*z",
+    "/".join(["*d*d*"] * 8) + "/z",
+])
+def test_glob_matching_time_is_not_exponential(pattern):
+    paths = ["/".join(f"d{i}" for i in range(25)) + "/x.py", "/".join(["d" * 200] * 20)]
+    regex = re.compile(github2file.glob_to_regex(pattern))
+    started = time.perf_counter()
+    assert not any(regex.fullmatch(path) for path in paths)
+    assert time.perf_counter() - started < 0.5
+
+def test_many_patterns_join_into_one_regex():
+    path_filter = github2file.PathFilter("python", include=["*a*b*c*.py"] * 50, exclude=["**/x*y*/**"] * 50, root_prefix="repo-main/")
+    assert path_filter("repo-main/src/abc.py")
+    assert not path_filter("repo-main/src/xy/abc.py")
+
+def generated_paths(count=20000, seed=0):
+    """Repository paths mixing every extension with the directories and file names the default filters look for."""
+    rng = random.Random(seed)
+    directories = ["src", "pkg", "lib", "examples", "tests", "test", "scripts", "utils", "benchmarks", "__pycache__", "vendor",
+                   ".github", ".hidden", "node_modules", "docs", "Testing", "my_utils", "vendored", "cmd"]
+    names = ["main", "setup", "hubconf", "stale", "gen-card-x", "write_model_card", "README", "LICENSE", "go", "Makefile",
+             "app", "contest", "module", ".env", "util"]
+    extensions = [".py", ".pyw", ".go", ".mod", ".sum", ".js", ".jsx", ".ts", ".tsx", ".java", ".md", ".txt", ".pyc", ""]
+    paths = []
+    for _ in range(count):
+        parts = [rng.choice(directories) for _ in range(rng.randrange(0, 4))]
+        path = "repo-main/" + "/".join(parts + [rng.choice(names) + rng.choice(extensions)])
+        paths.append(path + "/" if rng.random() < 0.02 else path)
+    return paths + [".gitignore", ".gitlab-ci.yml", "go.mod", "tests/a.py", "test.py", "a.py", "README.md"]
+
+@pytest.mark.parametrize("lang", ["python", "go", "javascript", "java", "md"])
+def test_default_decisions_match_the_original_filters(lang):
+    path_filter = github2file.PathFilter(lang)
+    decisions = [(path, path_filter(path)) for path in generated_paths()]
+    assert [path for path, kept in decisions if kept != (github2file.is_file_type(path, lang) and github2file.is_likely_useful_file(path, lang))] == []
+    assert any(kept for _, kept in decisions) and not all(kept for _, kept in decisions)
+
+def test_include_exclude_and_rules_precedence():
+    path_filter = github2file.PathFilter("python", include=["src/**", "tools/*.py"], exclude=["src/generated/**"],
+                                         rules=["*_cli.py", "!src/keep_cli.py", "!src/generated/kept.py"],
+                                         root_prefix="repo-main/")
+    assert path_filter("repo-main/src/core.py")
+    assert path_filter("repo-main/tools/build.py")
+    assert not path_filter("repo-main/tools/nested/build.py")  # Not included
+    assert not path_filter("repo-main/other/core.py")  # Not included
+    assert not path_filter("repo-main/src/run_cli.py")  # Ignored by a rule
+    assert path_filter("repo-main/src/keep_cli.py")  # Re-included by the later negated rule
+    assert not path_filter("repo-main/src/generated/kept.py")  # Exclude globs win over negated rules
+    assert not path_filter("repo-main/src/tests/core.py")  # The default filters still apply
+    assert not path_filter("repo-main/src/core.go")
+
+def test_rules_take_the_last_match():
+    path_filter = github2file.PathFilter("python", rules=["!a.py", "*.py"])
+    assert not path_filter("a.py")
+    path_filter = github2file.PathFilter("python", rules=["*.py", "!a.py"])
+    assert path_filter("a.py") and not path_filter("b.py")
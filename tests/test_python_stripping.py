@@ -0,0 +1,83 @@
+import bisect
+import dis
+import random
+import types
+
+import pytest
+
+import benchmark
+import github2file
+
+FRAGMENTS = [
+    'def {name}(value):\n    """Docstring of {name}."""\n    return value  # trailing comment\n',
+    'def {name}():\n    """Only a docstring."""\n',
+    'class {name}:\n    """Class docstring."""\n\n    # comment line\n    def method(self):\n        \'\'\'Method docstring.\'\'\'\n        return "# not a comment"\n',
+    'class {name}:\n    "Only a docstring."\n',
+    'async def {name}(session):\n    """Async docstring."""\n    async with session:\n        "bare string statement"\n        return await session.close()\n',
+    '@staticmethod\ndef {name}(items):\n    total = (1 +  # comment inside brackets\n             2)\n    return [item for item in items if item != "#"]\n',
+    'def {name}(value):\n    f"{{value}} evaluated for its side effects"\n    return value\n',
+    'if __name__ == "{name}":\n    """Dropped string."""\n    # comment\n    pass\n',
+    '{name} = """A module level string that is assigned, so it stays."""\n',
+    'def {name}(value):\n    x = value \\\n        + 1  # continued line\n    "string in the middle"\n    return x\n',
+    'try:\n    import {name}\nexcept ImportError:\n    """Optional dependency."""\n',
+    'for {name} in range(3):\n    """Loop body with only a string."""\nelse:\n    {name} = None\n',
+    'def {name}(value):\n    def inner():\n        """Nested docstring."""\n    return inner\n',
+]
+
+def code_signature(code):
+    """
+    Everything that determines what a code object does, without line numbers. The NOPs the compiler leaves
+    for lines without code are skipped, so jump targets are compared as instruction indices.
+    """
+    instructions = [instruction for instruction in dis.get_instructions(code) if instruction.opname != "NOP"]
+    offsets = [instruction.offset for instruction in instructions]
+    operations = []
+    for instruction in instructions:
+        if instruction.opcode in dis.hasjrel or instruction.opcode in dis.hasjabs:
+            operations.append((instruction.opname, bisect.bisect_left(offsets, instruction.argval)))
+        elif isinstance(instruction.argval, types.CodeType):
+            operations.append((instruction.opname, code_signature(instruction.argval)))
+        else:
+            operations.append((instruction.opname, type(instruction.argval), instruction.argval))
+    return (operations, code.co_varnames, code.co_freevars, code.co_cellvars, code.co_flags,
+            code.co_argcount, code.co_posonlyargcount, code.co_kwonlyargcount)
+
+def bytecode(source):
+    # optimize=2 drops docstrings, so only what the stripper must keep is compared
+    return code_signature(compile(source, "<stripped>", "exec", optimize=2))
+
+def generated_sources(count=200, seed=0):
+    rng = random.Random(seed)
+    for index in range(count):
+        if index % 4 == 0:
+            yield benchmark.make_python_file(rng, rng.randrange(1, 6))
+        else:
+            fragments = rng.choices(FRAGMENTS, k=rng.randrange(1, 8))
+            body = "\n".join(fragment.format(name=f"name{number}") for number, fragment in enumerate(fragments))
+            yield f'"""Module docstring."""\n# leading comment\nimport os\n\n{body}'
+
+@pytest.mark.parametrize("source", list(generated_sources()))
+def test_stripping_keeps_bytecode(source):
+    stripped = github2file.strip_python_comments(source)
+    assert not [line for line in stripped.splitlines() if line.lstrip().startswith("#")]
+    assert bytecode(stripped) == bytecode(source)
+    assert bytecode(stripped) == bytecode(github2file.remove_comments_and_docstrings(source))
+
+def test_docstring_only_blocks_get_pass():
+    source = 'class A:\n    """Only a docstring."""\n\ndef f():\n    """Only a docstring."""\n'
+    assert github2file.strip_python_comments(source) == "class A:\n    pass\n\ndef f():\n    pass\n"
+
+def test_fstring_statements_are_kept():
+    source = 'def f(value):\n    f"{value.close()}"\n    "plain"\n    return value\n'
+    assert github2file.strip_python_comments(source) == 'def f(value):\n    f"{value.close()}"\n    return value\n'
+
+def test_comments_are_removed_and_formatting_kept():
+    source = 'x = [1,   # first\n     2]\n# full line\ny = "# kept"  # trailing\n'
+    assert github2file.strip_python_comments(source) == 'x = [1,\n     2]\ny = "# kept"\n'
+
+def test_python2_source_tokenizes():
+    source = '# comment\nprint "hello"  # trailing\nexec "code"\ndef f():\n    """Doc."""\n    print >>sys.stderr, "x"\n'
+    with pytest.raises(SyntaxError):
+        compile(source, "<py2>", "exec")
+    assert github2file.strip_python_comments(source) == 'print "hello"\nexec "code"\ndef f():\n    print >>sys.stderr, "x"\n'
+    assert github2file.strip_python_source("py2.py", source) == github2file.strip_python_comments(source)
@@ -0,0 +1,160 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import http.server
+import threading
+import time
+
+import pytest
+import requests
+
+import benchmark
+import github2file
+from conftest import publish_archive
+
+class RecordingHandler(benchmark.RangeRequestHandler):
+    """Archive stand-in that records the headers of every request and can answer slowly."""
+    requests_seen = []
+    delay = 0
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, dict(self.headers)))
+        time.sleep(self.delay)
+        super().do_GET()
+
+@contextlib.contextmanager
+def archive_server(directory, delay=0):
+    handler_class = type("Handler", (RecordingHandler,), {"requests_seen": [], "delay": delay})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), lambda *args, **kwargs: handler_class(*args, directory=directory, **kwargs))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}", handler_class.requests_seen
+    finally:
+        server.shutdown()
+        server.server_close()
+
+@contextlib.contextmanager
+def running_server(**options):
+    """Run an ArchiveServer on an event loop in a background thread and yield its URL."""
+    loop = asyncio.new_event_loop()
+    server = github2file.ArchiveServer(**options)
+    listener = loop.run_until_complete(server.start("127.0.0.1", 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{listener.sockets[0].getsockname()[1]}"
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        listener.close()
+        loop.run_until_complete(listener.wait_closed())
+        server.close()
+        loop.close()
+
+@pytest.fixture
+def archive_root(tmp_path):
+    root = tmp_path / "srv"
+    for seed, name in enumerate(["alpha", "beta"]):
+        publish_archive(root, name, benchmark.generate_archive(tmp_path / f"{name}.zip", files=60, seed=seed))
+    return str(root)
+
+def fetch(server_url, repo_url, **params):
+    return requests.get(server_url, params={"repo_url": repo_url, **params}, timeout=30)
+
+def test_streams_the_same_output_as_the_cli(tmp_path, archive_root):
+    with archive_server(archive_root) as (base_url, _), running_server(allowed_hosts=["127.0.0.1"]) as server_url:
+        repo_url = f"{base_url}/github.com/u/alpha"
+        expected = open(github2file.download_repo(repo_url, str(tmp_path), "python", claude=True), "rb").read()
+        first, second = fetch(server_url, repo_url, claude="1"), fetch(server_url, repo_url, claude="1")
+        status = requests.get(f"{server_url}/status", timeout=30).json()
+    assert (first.status_code, first.headers["X-Cache"], first.headers["Transfer-Encoding"]) == (200, "miss", "chunked")
+    assert (second.status_code, second.headers["X-Cache"]) == (200, "hit")
+    assert first.content == second.content == expected
+    assert status["jobs"] == 1 and status["result_cache_hits"] == 1
+
+def test_concurrent_requests_share_one_job(archive_root):
+    with archive_server(archive_root, delay=0.5) as (base_url, seen), running_server(allowed_hosts=["127.0.0.1"]) as server_url:
+        repo_url = f"{base_url}/github.com/u/beta"
+        with concurrent.futures.ThreadPoolExecutor(6) as executor:
+            responses = list(executor.map(lambda _: fetch(server_url, repo_url), range(6)))
+    assert len(seen) == 1
+    assert sorted(response.headers["X-Cache"] for response in responses) == ["coalesced"] * 5 + ["miss"]
+    assert len({response.content for response in responses}) == 1
+
+def test_full_queue_is_rejected(archive_root):
+    with archive_server(archive_root, delay=1) as (base_url, _), running_server(allowed_hosts=["127.0.0.1"], concurrency=1, queue_size=0) as server_url:
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            running = executor.submit(fetch, server_url, f"{base_url}/github.com/u/alpha")
+            time.sleep(0.3)
+            rejected = fetch(server_url, f"{base_url}/github.com/u/beta")
+            assert running.result().status_code == 200
+    assert (rejected.status_code, rejected.headers["Retry-After"]) == (503, "1")
+
+def test_bad_requests(archive_root):
+    with archive_server(archive_root) as (base_url, seen), running_server(allowed_hosts=["127.0.0.1"]) as server_url:
+        assert fetch(server_url, "/etc").status_code == 400
+        assert fetch(server_url, f"{base_url}/github.com/u/alpha", lang="cobol").status_code == 400
+        missing = fetch(server_url, f"{base_url}/github.com/u/missing")
+        assert missing.status_code == 502 and "HTTP 404" in missing.text
+        assert requests.post(server_url, timeout=30).status_code == 405
+    with running_server() as server_url:
+        # A URL merely mentioning github.com is not on github.com
+        assert fetch(server_url, f"{base_url}/github.com/u/alpha").status_code == 400
+        assert fetch(server_url, "http://attacker.example/github.com/x/y").status_code == 400
+    assert [path for path, _ in seen if "alpha" in path] == []
+
+def test_token_is_only_sent_to_the_provider(archive_root):
+    with archive_server(archive_root) as (base_url, seen), running_server(allowed_hosts=["127.0.0.1"], token="SECRET") as server_url:
+        assert fetch(server_url, f"{base_url}/github.com/u/alpha").status_code == 200
+    assert seen and all("SECRET" not in str(headers) for _, headers in seen)
+    assert github2file.token_headers("https://github.com/u/repo", "SECRET") == {"Authorization": "token SECRET"}
+    assert github2file.token_headers("https://gitlab.com/u/repo", "SECRET") == {"PRIVATE-TOKEN": "SECRET"}
+    assert github2file.token_headers("http://attacker.example/github.com/u/repo", "SECRET") == {}
+    assert github2file.token_headers("https://github.com.attacker.example/u/repo", "SECRET") == {}
+
+def test_jobs_keep_at_most_max_replay_bytes_for_late_requests():
+    async def scenario():
+        job = github2file.ServerJob(max_replay=10)
+        early = job.attach()
+        received = []
+
+        async def read():
+            async for chunk in job.stream(early):
+                received.append(chunk)
+
+        reading = asyncio.get_running_loop().create_task(read())
+        for index in range(5):
+            job.append(b"%d-chunk" % index)
+            await asyncio.sleep(0)
+            assert len(job.chunks) <= 2
+        assert not job.joinable and job.first > 0
+        job.finish()
+        await reading
+        job.detach(early)
+        return received, job
+
+    received, job = asyncio.run(scenario())
+    # The reader attached from the start still gets every chunk, while the job only holds the unsent ones
+    assert received == [b"%d-chunk" % index for index in range(5)]
+    assert not job.chunks
+
+def test_outputs_beyond_max_replay_are_streamed_but_not_kept(archive_root):
+    with archive_server(archive_root, delay=0.5) as (base_url, seen), running_server(allowed_hosts=["127.0.0.1"], max_replay=1024) as server_url:
+        repo_url = f"{base_url}/github.com/u/alpha"
+        with concurrent.futures.ThreadPoolExecutor(3) as executor:
+            responses = list(executor.map(lambda _: fetch(server_url, repo_url), range(3)))
+        again = fetch(server_url, repo_url)
+        status = requests.get(f"{server_url}/status", timeout=30).json()
+    assert len({response.content for response in responses + [again]}) == 1 and len(again.content) > 1024
+    # A job past max_replay bytes does not leave its output in the result cache
+    assert again.headers["X-Cache"] == "miss" and status["cached_results"] == 0 and status["running"] == 0
+
+def test_pattern_limits(archive_root):
+    with archive_server(archive_root) as (base_url, _), running_server(allowed_hosts=["127.0.0.1"]) as server_url:
+        repo_url = f"{base_url}/github.com/u/alpha"
+        assert fetch(server_url, repo_url, include=[f"src/{index}/*.py" for index in range(33)]).status_code == 400
+        assert fetch(server_url, repo_url, exclude="*" * 257).status_code == 400
+        # The most backtracking-prone pattern allowed is still decided quickly on every path
+        started = time.perf_counter()
+        response = fetch(server_url, repo_url, include="**/*a*a*a*a*a*a*a*a*a*a*a*a*a*a*a*a*a*a*a*a*a*a*a*a*a*a*a*a*a*b/**/*x")
+        assert response.status_code == 200 and time.perf_counter() - started < 5
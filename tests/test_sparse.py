@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+import benchmark
+import github2file
+from conftest import publish_archive, serve_without_ranges
+
+@pytest.fixture
+def interleaved(tmp_path):
+    """A repository where one file in ten is Go, interleaved with Python files; yields (root, repo path, archive size)."""
+    root = tmp_path / "srv"
+    archive = benchmark.generate_archive(tmp_path / "interleaved.zip", files=8000, mix="python=0.9,go=0.1", seed=3)
+    yield str(root), publish_archive(root, "interleaved", archive), os.path.getsize(archive)
+
+def download(repo_url, output_folder, **options):
+    os.makedirs(output_folder, exist_ok=True)
+    with open(github2file.download_repo(repo_url, output_folder, "go", **options), "rb") as output_file:
+        return output_file.read()
+
+def test_sparse_fetches_only_matching_members(tmp_path, interleaved):
+    root, repo, size = interleaved
+    stats = github2file.RunStats()
+    with benchmark.serve_directory(root) as base_url:
+        full = download(f"{base_url}/{repo}", str(tmp_path / "full"))
+        sparse = download(f"{base_url}/{repo}", str(tmp_path / "sparse"), sparse=True, stats=stats)
+    assert sparse == full
+    assert stats.bytes["downloaded"] < size / 2
+
+def test_sparse_falls_back_when_range_is_ignored(tmp_path, interleaved, capsys):
+    root, repo, size = interleaved
+    with benchmark.serve_directory(root) as base_url:
+        full = download(f"{base_url}/{repo}", str(tmp_path / "full"))
+    with serve_without_ranges(root) as base_url:
+        sparse = download(f"{base_url}/{repo}", str(tmp_path / "sparse"), sparse=True)
+    assert sparse == full
+    assert "does not support range requests" in capsys.readouterr().out
+
+def test_prefetch_coalesces_only_cheap_gaps(interleaved):
+    root, repo, size = interleaved
+    with benchmark.serve_directory(root) as base_url:
+        remote_file = github2file.HttpRangeFile(github2file.construct_download_url(f"{base_url}/{repo}", "main"), size)
+        remote_file.prefetch([(0, 1000), (1000, 3000), (3100, 4000)])
+        assert (remote_file.requests_made, remote_file.bytes_fetched) == (1, 4000)
+        remote_file.prefetch([(10000, 10100), (20000, 20100)])
+        assert (remote_file.requests_made, remote_file.bytes_fetched) == (3, 4200)
+        remote_file.seek(10000)
+        assert remote_file.read(100) == open(os.path.join(root, repo, "archive", "refs", "heads", "main.zip"), "rb").read()[10000:10100]
+        remote_file.close()
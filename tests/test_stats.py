@@ -0,0 +1,36 @@
+import random
+import zipfile
+
+import pytest
+
+import benchmark
+import github2file
+
+@pytest.fixture
+def archive(tmp_path):
+    """A repository with one Latin-1 Python file, one .pyw file with a syntax error and one file over the size limit."""
+    path = tmp_path / "repo.zip"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr("repo-main/README.md", "# Repository\n")
+        source = benchmark.make_python_file(random.Random(0), 3) + '\n\ndef greet():\n    return "gr\xfc\xdfe"\n'
+        zip_file.writestr("repo-main/src/latin1.py", source.encode("latin-1"))
+        zip_file.writestr("repo-main/src/large.py", "VALUE = 1\n" * 20000)
+        zip_file.writestr("repo-main/src/broken.pyw", "def broken(:\n" + "    value = 1  # comment\n" * 20)
+        for index in range(5):
+            zip_file.writestr(f"repo-main/src/module{index}.py", benchmark.make_python_file(random.Random(index), 2))
+    return str(path)
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_decode_errors_and_prefilter_bytes_are_recorded(tmp_path, archive, jobs):
+    stats = github2file.RunStats()
+    output = github2file.download_repo(archive, str(tmp_path), "python", jobs=jobs, max_file_size=100 * 1024, stats=stats)
+    assert stats.warnings == {"decode_error": 1, "syntax_error": 1}
+    assert stats.skipped["oversized_or_generated"] == 1
+    # Files kept with a warning are not skips, so the counts add up
+    assert stats.files["processed"] == stats.files["written"] + sum(stats.skipped[reason] for reason in ("test_content", "insufficient_content", "budget"))
+    assert "value = 1  # comment" in open(output, encoding="utf-8").read()
+    assert stats.bytes["prefilter_skipped"] == len("VALUE = 1\n" * 20000)
+    # The file that is not UTF-8 is still kept, with the undecodable bytes replaced
+    assert 'return "gr��e"' in open(output, encoding="utf-8").read()
+    assert "prefilter_skipped" in stats.to_dict()["bytes"]
+    assert stats.to_dict()["warnings"] == {"decode_error": 1, "syntax_error": 1}
@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+import benchmark
+from conftest import REPO_ROOT, publish_archive
+
+resource = pytest.importorskip("resource")
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="ru_maxrss is reported in KB only on Linux")
+
+MAX_MEMORY = 4 * 1024 * 1024
+BLOB_CHUNK = 1024 * 1024
+
+PEAK_RSS_SCRIPT = """
+import resource, sys
+import github2file
+github2file.download_repo(sys.argv[1], sys.argv[2], "python", max_memory=int(sys.argv[3]))
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+def make_archive(path, blob_size):
+    """A small synthetic repository padded with blob_size bytes of incompressible data the filters skip."""
+    benchmark.generate_archive(path, files=200, seed=1)
+    with zipfile.ZipFile(path, "a", zipfile.ZIP_STORED) as zip_file:
+        with zip_file.open("bench-main/assets/blob.bin", "w", force_zip64=True) as blob:
+            for _ in range(blob_size // BLOB_CHUNK):
+                blob.write(os.urandom(BLOB_CHUNK))
+    return path
+
+def peak_rss(repo_url, output_dir):
+    """Download and process repo_url in a fresh interpreter and return its peak RSS in bytes."""
+    result = subprocess.run([sys.executable, "-c", PEAK_RSS_SCRIPT, repo_url, str(output_dir), str(MAX_MEMORY)],
+                            cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    return int(result.stdout.split()[-1]) * 1024
+
+def test_peak_rss_does_not_grow_with_archive_size(tmp_path):
+    root = tmp_path / "srv"
+    small = publish_archive(root, "small", make_archive(tmp_path / "small.zip", 8 * BLOB_CHUNK))
+    large = publish_archive(root, "large", make_archive(tmp_path / "large.zip", 128 * BLOB_CHUNK))
+    (tmp_path / "out").mkdir()
+    with benchmark.serve_directory(str(root)) as base_url:
+        small_rss = peak_rss(f"{base_url}/{small}", tmp_path / "out")
+        large_rss = peak_rss(f"{base_url}/{large}", tmp_path / "out")
+    # Buffering the archive in memory would add the 120 MB difference in archive size
+    assert large_rss - small_rss < 24 * 1024 * 1024
+    assert (tmp_path / "out" / "small_python.txt").read_bytes() == (tmp_path / "out" / "large_python.txt").read_bytes()
@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+import benchmark
+import github2file
+
+class Cancelled(Exception):
+    pass
+
+@pytest.fixture
+def archives(tmp_path):
+    return [str(benchmark.generate_archive(tmp_path / f"repo{seed}.zip", files=200, mix="python=1", seed=seed)) for seed in range(2)]
+
+def run_in_thread(function, *args, **kwargs):
+    """Run function on a new thread and return (thread, outcome), where outcome gets the result or exception."""
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = function(*args, **kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread, outcome
+
+def test_concurrent_runs_share_the_cache(tmp_path, archives):
+    cache_dir = str(tmp_path / "cache")
+    expected = [open(github2file.download_repo(archive, str(tmp_path), "python", output_path=str(tmp_path / f"expected{index}.txt")), "rb").read()
+                for index, archive in enumerate(archives)]
+    first_paused, second_done = threading.Event(), threading.Event()
+
+    def pause_halfway(stage, done, total):
+        # The first run stops halfway, after writing cache entries, until the second run has finished
+        if stage == "process" and done == total // 2:
+            first_paused.set()
+            assert second_done.wait(30), "the second run waited on the first one"
+
+    first, first_outcome = run_in_thread(github2file.download_repo, archives[0], str(tmp_path), "python", output_path=str(tmp_path / "first.txt"),
+                                         transform_cache=github2file.TransformCache(cache_dir), progress=pause_halfway)
+    assert first_paused.wait(30)
+    second, second_outcome = run_in_thread(github2file.download_repo, archives[1], str(tmp_path), "python", output_path=str(tmp_path / "second.txt"),
+                                           transform_cache=github2file.TransformCache(cache_dir))
+    second.join(60)
+    second_done.set()
+    first.join(60)
+    assert "error" not in first_outcome and "error" not in second_outcome
+    assert [open(outcome["result"], "rb").read() for outcome in (first_outcome, second_outcome)] == expected
+
+def test_cancelled_run_does_not_block_the_next(tmp_path, archives):
+    cache_dir = str(tmp_path / "cache")
+
+    def cancel(stage, done, total):
+        if stage == "process" and done == total // 2:
+            raise Cancelled()
+
+    cancelled, outcome = run_in_thread(github2file.download_repo, archives[0], str(tmp_path), "python",
+                                       transform_cache=github2file.TransformCache(cache_dir), progress=cancel)
+    cancelled.join(60)
+    assert isinstance(outcome.get("error"), Cancelled)
+
+    transform_cache = github2file.TransformCache(cache_dir)
+    rerun, outcome = run_in_thread(github2file.download_repo, archives[0], str(tmp_path), "python", transform_cache=transform_cache)
+    rerun.join(60)
+    assert "error" not in outcome
+    expected = github2file.download_repo(archives[0], str(tmp_path), "python", output_path=str(tmp_path / "expected.txt"))
+    assert open(outcome["result"], "rb").read() == open(expected, "rb").read()
+    # The files processed before the cancellation were kept
+    assert transform_cache.hits >= 50
@@ -1,9 +1,6 @@
 import os
 import sys
-import requests
-import zipfile
-import io
-import ast
+from github2file import fetch_archive, strip_comments
 
 def is_desired_file(file_path):
     """Check if the file is a Python, JavaScript, TypeScript, Svelte, or Rust file."""
@@ -34,25 +31,12 @@ def has_sufficient_content(file_content, min_line_count=10):
     lines = [line for line in file_content.split('\n') if line.strip() and not line.strip().startswith('#')]
     return len(lines) >= min_line_count
 
-def remove_comments_and_docstrings(source):
-    """Remove comments and docstrings from the Python source code."""
-    tree = ast.parse(source)
-    for node in ast.walk(tree):
-        if isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.AsyncFunctionDef)) and ast.get_docstring(node):
-            node.body = node.body[1:]  # Remove docstring
-        elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Str):
-            node.value.s = ""  # Remove comments
-    return ast.unparse(tree)
-
-
-
 def download_repo(repo_url, output_file):
     """Download and process files from a GitHub repository."""
     if '/tree/' in repo_url:
         repo_url = f'https://download-directory.github.io/?{repo_url}'
 
-    response = requests.get(f"{repo_url}/archive/master.zip")
-    zip_file = zipfile.ZipFile(io.BytesIO(response.content))
+    zip_file = fetch_archive(f"{repo_url}/archive/master.zip")
 
     with open(output_file, "w", encoding="utf-8") as outfile:
         for file_path in zip_file.namelist():
@@ -66,11 +50,7 @@ def download_repo(repo_url, output_file):
             if is_desired_file(file_content) or not has_sufficient_content(file_content):
                 continue
 
-            try:
-                file_content = remove_comments_and_docstrings(file_content)
-            except SyntaxError:
-                # Skip files with syntax errors
-                continue
+            file_content = strip_comments(file_path, file_content)
 
             outfile.write(f"# File: {file_path}\n")
             outfile.write(file_content)